@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from demo_esutils.mappings import ArticleMappingType
+
+
+AVAILABLE_MAPPING_TYPES = [
+    ArticleMappingType,
+]
+
+
+class Command(BaseCommand):
+    args = "rebuild_index"
+    help = """Rebuilds a new index and swaps the alias to it."""
+    option_list = BaseCommand.option_list + (
+        make_option('--keep-previous',
+                    action='store_true',
+                    dest='keep_previous',
+                    default=False,
+                    help='Do not delete the previous index.'),
+    )
+
+    def handle(self, *args, **options):
+        index = ArticleMappingType.rebuild_index(
+            mapping_types=AVAILABLE_MAPPING_TYPES,
+            keep_previous=options['keep_previous'])
+        self.stdout.write('{0} is now serving.'.format(index))
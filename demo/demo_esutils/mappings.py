@@ -3,6 +3,8 @@ from django.db.models.signals import post_save
 from django.db.models.signals import post_delete
 
 from django_esutils.mappings import SearchMappingType
+from django_esutils.models import post_bulk_create
+from django_esutils.models import post_bulk_delete
 from django_esutils.models import post_update
 
 from demo_esutils.models import Article
@@ -67,6 +69,10 @@ ARTICLE_MAPPING = {
 
 class ArticleMappingType(SearchMappingType):
 
+    updated_field = 'updated_at'
+    use_tombstones = True
+    partial_update = True
+
     @classmethod
     def get_model(cls):
         return Article
@@ -75,10 +81,11 @@ class ArticleMappingType(SearchMappingType):
     def get_field_mapping(cls):
         return ARTICLE_MAPPING
 
-    def get_object(self):
-        return ArticleMappingType.get_object_by_id(self._id)
-
 
 post_save.connect(ArticleMappingType.on_post_save, sender=Article)
 post_delete.connect(ArticleMappingType.on_post_delete, sender=Article)
 post_update.connect(ArticleMappingType.on_post_update, sender=Article)
+post_bulk_create.connect(ArticleMappingType.on_post_bulk_create,
+                         sender=Article)
+post_bulk_delete.connect(ArticleMappingType.on_post_bulk_delete,
+                         sender=Article)
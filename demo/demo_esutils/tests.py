@@ -1,20 +1,120 @@
+import shutil
+import tempfile
 from datetime import datetime
 from functools import partial
 
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import EmptyPage
+from django.core.paginator import PageNotAnInteger
+from django.contrib.sessions.models import Session
+from django.db import models
+from django.db.transaction import TransactionManagementError
+from django.http import Http404
+from django.test import RequestFactory
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
 from django.core.urlresolvers import reverse
 from django.utils.timezone import get_current_timezone
 from django.utils.timezone import make_aware
+from django.utils.timezone import now
+from django.utils.timezone import utc
 
 from elasticutils import F
+from elasticutils import decorate_with_metadata
 
 from freezegun import freeze_time
 
+from rest_framework.generics import ListAPIView
+from rest_framework.request import Request
+
 from demo_esutils.models import Category
 from demo_esutils.models import Article
 from demo_esutils.models import User
 from demo_esutils.mappings import ArticleMappingType as M
+from django_esutils.mappings import S
+from django_esutils.mappings import SearchMappingType
+from django_esutils import models as esutils_models
+from django_esutils.models import ESQuerySet
+from django_esutils.models import IndexOutbox
+from django_esutils.models import IndexTombstone
+from django_esutils.models import chunked_pks
+from django_esutils.models import post_bulk_create
+from django_esutils.models import post_bulk_delete
+from django_esutils.models import post_update
+from django_esutils.outbox import drain_outbox
+from django_esutils.outbox import push
+from django_esutils.transaction import coalesce_indexing
+from django_esutils.transaction import get_index_buffer
+from django_esutils.bulk import BulkResult
+from django_esutils.bulk import bulk_lines
+from django_esutils.cache import LRUCache
+from django_esutils.bulk import chunk_bodies
+from django_esutils.filters import ElasticutilsFilterBackend
 from django_esutils.filters import ElasticutilsFilterSet
+from django_esutils.filters import clean_ids
+from django_esutils.query_string import QueryStringError
+from django_esutils.query_string import Term
+from django_esutils.query_string import parse_query_string
+from django_esutils.views import SearchPaginator
+from demo_esutils.views import ArticleRestListView
+from demo_esutils.views import ArticleSourceSerializer
+
+
+def get_shared_cache(test):
+    """Returns a cache shared by processes, removed after the test."""
+    location = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, location)
+    return FileBasedCache(location, {})
+
+
+class FakeIndices(object):
+    """Indices client recording created indexes."""
+
+    def __init__(self):
+        self.created = []
+
+    def create(self, index, body=None, **kwargs):
+        self.created.append((index, body))
+
+
+class FakeES(object):
+    """Elasticsearch client recording searches and indexed documents.
+
+    Searches hit the hits sources, paginated by the from and size of their
+    body, their total is total or the number of searches so far.
+    """
+
+    def __init__(self, hits=(), total=None):
+        self.hits = list(hits)
+        self.total = total
+        self.searches = []
+        self.indexed = []
+        self.deleted = []
+        self.indices = FakeIndices()
+
+    def search(self, body, index=None, doc_type=None, **kwargs):
+        self.searches.append(body)
+        start = body.get('from', 0)
+        total = len(self.searches) if self.total is None else self.total
+        return {'took': 1, 'hits': {
+            'total': total,
+            'hits': self.hits[start:start + body.get('size', 10)]}}
+
+    def index(self, index, doc_type, body, id=None, **params):
+        self.indexed.append((index, doc_type, body, id))
+
+    def delete(self, index, doc_type, id, **params):
+        self.deleted.append((index, doc_type, id))
+
+
+def get_fake_s(es):
+    """Returns an `S` class searching with the es client."""
+    class FakeS(S):
+        def get_es(self, **kwargs):
+            return es
+    return FakeS
 
 
 class BaseTest(TestCase):
@@ -55,8 +155,1280 @@ class BaseTest(TestCase):
         return make_aware(datetime(*args), get_current_timezone())
 
 
+@override_settings(ES_DISABLED=True)
+class ExtractionTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def test_related_lookups(self):
+        self.assertEqual(M.get_related_lookups(),
+                         (['author', 'category', 'library'], ['contributors']))
+
+    def test_extraction_plan(self):
+        self.assertIs(M.get_extraction_plan(), M.get_extraction_plan())
+
+        doc = M.extract_document(1)
+        self.assertEqual(doc['id'], '1')
+        self.assertEqual(doc['author.username'], 'florent')
+        self.assertEqual(doc['category.name'], 'Some Category')
+        self.assertEqual(doc['library'], {'id': 1,
+                                          'name': 'my library 1',
+                                          'number_of_books': 12})
+        self.assertEqual(doc['contributors'],
+                         [{'id': 1, 'username': 'florent'},
+                          {'id': 2, 'username': 'louise'}])
+
+        doc = M.extract_document(2)
+        self.assertEqual(doc['library'], None)
+        self.assertEqual(doc['contributors'], [])
+
+    def test_extract_documents(self):
+        ids = list(Article.objects.order_by('pk').values_list('pk', flat=True))
+        expected = [M.extract_document(pk) for pk in ids]
+
+        # one query for the articles plus one for the contributors
+        with self.assertNumQueries(2):
+            docs = list(M.extract_documents(ids))
+
+        self.assertEqual(docs, expected)
+
+        # chunked
+        with self.assertNumQueries(4):
+            docs = list(M.extract_documents(ids, chunk_size=2))
+
+        self.assertEqual(docs, expected)
+
+    def test_iter_documents(self):
+        expected = list(M.extract_documents([1, 2, 3, 4]))
+
+        # two queries per chunk: the articles, then their contributors, plus
+        # the last empty chunk
+        with self.assertNumQueries(5):
+            docs = list(M.iter_documents(chunk_size=2))
+        self.assertEqual(docs, expected)
+
+        class ValuesMappingType(M):
+            extraction_mode = 'values'
+
+        with self.assertNumQueries(5):
+            docs = list(ValuesMappingType.iter_documents(chunk_size=2))
+        self.assertEqual(docs, expected)
+
+    def test_extract_documents_from_values(self):
+        ids = list(Article.objects.order_by('pk').values_list('pk', flat=True))
+        expected = list(M.extract_documents(ids))
+
+        class ValuesMappingType(M):
+            extraction_mode = 'values'
+
+        # one query for the articles plus one for the contributors
+        with self.assertNumQueries(2):
+            docs = list(ValuesMappingType.extract_documents(ids))
+
+        self.assertEqual(docs, expected)
+
+
+@override_settings(ES_DISABLED=True)
+class PartitionTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def test_pk_partitions(self):
+        self.assertEqual(M.get_pk_partitions(1), [(1, 4)])
+        self.assertEqual(M.get_pk_partitions(2), [(1, 2), (3, 4)])
+        self.assertEqual(M.get_pk_partitions(3), [(1, 2), (3, 4)])
+        self.assertEqual(M.get_pk_partitions(8),
+                         [(1, 1), (2, 2), (3, 3), (4, 4)])
+
+        Article.objects.all().delete()
+        self.assertEqual(M.get_pk_partitions(2), [])
+
+    def test_pk_partitions_not_integer(self):
+        class SessionMappingType(M):
+            @classmethod
+            def get_model(cls):
+                return Session
+
+        Session.objects.create(session_key='a', session_data='',
+                               expire_date=now())
+        self.assertRaises(ImproperlyConfigured,
+                          SessionMappingType.get_pk_partitions, 2)
+
+    def test_run_index_partitioned_atomic(self):
+        # TestCase runs inside an atomic block
+        self.assertRaises(TransactionManagementError,
+                          M.run_index_partitioned, partitions=2)
+
+
+@override_settings(ES_DISABLED=True)
+class PartitionProcessTestCase(TransactionTestCase):
+    fixtures = ['test_data']
+
+    def test_run_index_partitioned(self):
+        def bulk_index_ids(cls, ids, **kwargs):
+            result = BulkResult()
+            result.success = len(ids)
+            result.requests = 1
+            return result
+
+        M.bulk_index_ids = classmethod(bulk_index_ids)
+        try:
+            results = M.run_index_partitioned(partitions=2, number=1)
+        finally:
+            del M.bulk_index_ids
+
+        self.assertEqual([(r, result.success, result.requests)
+                          for r, result in results],
+                         [((1, 2), 2, 2), ((3, 4), 2, 2)])
+        # the parent connection is still usable
+        self.assertEqual(Article.objects.count(), 4)
+
+
+@override_settings(ES_DISABLED=True)
+class DeltaTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def test_index_delta(self):
+        self.assertEqual(M.get_delta_checkpoint(), None)
+
+        result = M.run_index_delta(chunk_size=3)
+        self.assertEqual(result.errors, [])
+        last_date = Article.objects.order_by('-updated_at')[0].updated_at
+        self.assertEqual(M.get_delta_checkpoint(), last_date)
+
+        # modified objects move the checkpoint forward
+        article = Article.objects.get(pk=2)
+        article.save()
+        M.run_index_delta()
+        self.assertEqual(M.get_delta_checkpoint(),
+                         Article.objects.get(pk=2).updated_at)
+
+        # updated querysets as well
+        Article.objects.filter(pk=1).update(subject='delta')
+        self.assertTrue(Article.objects.get(pk=1).updated_at >
+                        M.get_delta_checkpoint())
+        M.run_index_delta()
+        self.assertEqual(M.get_delta_checkpoint(),
+                         Article.objects.get(pk=1).updated_at)
+
+        # deleted objects are tombstoned until the next delta
+        Article.objects.get(pk=3).delete()
+        tombstones = IndexTombstone.objects.filter(
+            mapping_type=M.get_mapping_type_path())
+        self.assertEqual(list(tombstones.values_list('object_id', flat=True)),
+                         ['3'])
+        M.run_index_delta()
+        self.assertFalse(tombstones.exists())
+
+    def test_replay_delta(self):
+        # replayed into a new index, ex.: by rebuild_index
+        started = now()
+        Article.objects.get(pk=3).delete()
+        result = M.run_index_delta(since=started, checkpoint=False)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(M.get_delta_checkpoint(), None)
+        self.assertTrue(IndexTombstone.objects.filter(
+            mapping_type=M.get_mapping_type_path(), object_id='3').exists())
+
+
+@override_settings(ES_DISABLED=True)
+class CoalesceIndexingTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def test_coalesce_indexing(self):
+        self.assertIsNone(get_index_buffer())
+
+        with coalesce_indexing():
+            article = Article.objects.get(pk=1)
+            for i in range(5):
+                article.save()
+            Article.objects.filter(pk__in=[1, 2]).update(status=1)
+
+            with coalesce_indexing():
+                Article.objects.get(pk=3).delete()
+
+            buffer = get_index_buffer()
+            self.assertEqual(buffer.get_ids(M, 'index'), [1, 2])
+            self.assertEqual(buffer.get_ids(M, 'unindex'), [3])
+
+        self.assertIsNone(get_index_buffer())
+        self.assertEqual(buffer.jobs, {})
+
+    def test_coalesce_indexing_rollback(self):
+
+        @coalesce_indexing
+        def delete_all():
+            with coalesce_indexing():
+                Article.objects.get(pk=1).delete()
+            buffer = get_index_buffer()
+            self.assertEqual(buffer.get_ids(M, 'unindex'), [1])
+            raise ValueError()
+
+        self.assertRaises(ValueError, delete_all)
+        self.assertTrue(Article.objects.filter(pk=1).exists())
+        self.assertIsNone(get_index_buffer())
+
+
+@override_settings(ES_DISABLED=True)
+class OutboxTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super(OutboxTestCase, self).setUp()
+        M.use_outbox = True
+
+    def tearDown(self):
+        del M.use_outbox
+        super(OutboxTestCase, self).tearDown()
+
+    def test_outbox(self):
+        article = Article.objects.get(pk=1)
+        article.save()
+        article.save()
+        Article.objects.filter(pk=2).update(status=1)
+        Article.objects.get(pk=3).delete()
+
+        self.assertEqual(
+            list(IndexOutbox.objects.order_by('pk').values_list(
+                'mapping_type', 'object_id', 'op')),
+            [(M.get_mapping_type_path(), '1', 'index'),
+             (M.get_mapping_type_path(), '1', 'index'),
+             (M.get_mapping_type_path(), '2', 'index'),
+             (M.get_mapping_type_path(), '3', 'unindex')])
+
+        count, result = drain_outbox(batch_size=3)
+        self.assertEqual(count, 3)
+        self.assertEqual(IndexOutbox.objects.count(), 1)
+
+        count, result = drain_outbox(batch_size=3)
+        self.assertEqual(count, 1)
+        self.assertFalse(IndexOutbox.objects.exists())
+
+        self.assertEqual(drain_outbox()[0], 0)
+
+    def test_outbox_retries(self):
+        def bulk_index_ids(cls, ids, **kwargs):
+            result = BulkResult()
+            result.errors = [{'index': {'_id': obj_id, 'status': 500}}
+                             for obj_id in ids if obj_id == '1']
+            return result
+
+        M.bulk_index_ids = classmethod(bulk_index_ids)
+        try:
+            push(M, ['1'], 'index')
+            self.assertEqual(drain_outbox(max_attempts=2)[0], 1)
+            row = IndexOutbox.objects.get()
+            self.assertEqual((row.attempts, row.dead), (1, False))
+            self.assertTrue(row.next_attempt_at > now())
+
+            # the failed row backs off, newer rows are drained
+            push(M, ['2'], 'index')
+            self.assertEqual(drain_outbox(max_attempts=2)[0], 1)
+            self.assertEqual(IndexOutbox.objects.get().object_id, '1')
+
+            # dead after max_attempts, never claimed again
+            IndexOutbox.objects.update(next_attempt_at=now())
+            self.assertEqual(drain_outbox(max_attempts=2)[0], 1)
+            row = IndexOutbox.objects.get()
+            self.assertEqual((row.attempts, row.dead), (2, True))
+            IndexOutbox.objects.update(next_attempt_at=now())
+            self.assertEqual(drain_outbox(max_attempts=2)[0], 0)
+        finally:
+            del M.bulk_index_ids
+
+    def test_outbox_read_database(self):
+        # rows are written to the default database, the read alias is kept
+        push(M, ['1'], 'index', database='replica')
+        push(M, ['2'], 'unindex')
+        self.assertEqual(
+            list(IndexOutbox.objects.using('default').order_by('pk')
+                 .values_list('object_id', 'database')),
+            [('1', 'replica'), ('2', '')])
+
+
+class PartialUpdateTestCase(TestCase):
+
+    def test_partial_document(self):
+        self.assertEqual(M.get_partial_document({'status': '1'}),
+                         {'status': 1})
+        self.assertEqual(M.get_partial_document({'status': 2,
+                                                 'subject': 'hey'}),
+                         {'status': 2, 'subject': 'hey'})
+
+        # not mapped
+        self.assertEqual(M.get_partial_document({'library': None,
+                                                 'status': 1}), None)
+        # related and id fields are extracted
+        self.assertEqual(M.get_partial_document({'category': None}), None)
+        self.assertEqual(M.get_partial_document({'id': 5}), None)
+        # expressions are only known by the database
+        values = {'status': models.F('status') + 1}
+        self.assertEqual(M.get_partial_document(values), None)
+
+        class ComputedMappingType(M):
+
+            @classmethod
+            def get_field_mapping(cls):
+                mapping = dict(M.get_field_mapping())
+                mapping['summary'] = {'type': 'string'}
+                return mapping
+
+        self.assertEqual(
+            ComputedMappingType.get_partial_document({'status': 1}), None)
+
+        # opt-in, extract_document may be overridden
+        class ExtractedMappingType(M):
+            partial_update = False
+
+        self.assertEqual(
+            ExtractedMappingType.get_partial_document({'status': 1}), None)
+
+
+@override_settings(ES_DISABLED=True)
+class QuerySetUpdateTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super(QuerySetUpdateTestCase, self).setUp()
+        self.signals = []
+        post_update.connect(self.on_post_update, sender=Article)
+        self.chunk_size = ESQuerySet.chunk_size
+        ESQuerySet.chunk_size = 2
+
+    def tearDown(self):
+        ESQuerySet.chunk_size = self.chunk_size
+        post_update.disconnect(self.on_post_update, sender=Article)
+        super(QuerySetUpdateTestCase, self).tearDown()
+
+    def on_post_update(self, sender, queryset, ids, values, **kwargs):
+        self.signals.append((ids, values))
+
+    def test_update_chunks(self):
+        # updated rows do not match the filter anymore, auto_now fields are
+        # updated as well
+        with freeze_time('2014-10-12 12:00:00'):
+            result = Article.objects.filter(status__lt=3).update(status=3)
+        self.assertEqual(result, 3)
+        updated = {'status': 3, 'updated_at': make_aware(
+            datetime(2014, 10, 12, 12), utc)}
+        self.assertEqual(self.signals, [([1, 2], updated), ([3], updated)])
+        self.assertEqual(Article.objects.filter(status=3).count(), 4)
+
+        self.signals = []
+        self.assertEqual(Article.objects.update(status=0), 4)
+        self.assertEqual([ids for ids, values in self.signals],
+                         [[1, 2], [3, 4]])
+
+        self.signals = []
+        self.assertEqual(Article.objects.filter(pk=0).update(status=0), 0)
+        self.assertEqual(self.signals, [])
+
+    def test_update_atomic(self):
+        counts = []
+
+        def on_post_update(sender, ids, **kwargs):
+            counts.append(Article.objects.filter(status=5).count())
+
+        def failing_chunked_pks(queryset, chunk_size):
+            for i, ids in enumerate(chunked_pks(queryset, chunk_size)):
+                if i:
+                    raise ValueError()
+                yield ids
+
+        post_update.connect(on_post_update, sender=Article)
+        try:
+            # signals are sent once every chunk is updated
+            Article.objects.update(status=5)
+            self.assertEqual(counts, [4, 4])
+
+            # the first chunk is rolled back, nothing is signaled
+            esutils_models.chunked_pks = failing_chunked_pks
+            with self.assertRaises(ValueError):
+                Article.objects.update(status=6)
+        finally:
+            esutils_models.chunked_pks = chunked_pks
+            post_update.disconnect(on_post_update, sender=Article)
+        self.assertFalse(Article.objects.filter(status=6).exists())
+        self.assertEqual(counts, [4, 4])
+
+    def test_delete_atomic(self):
+        counts = []
+
+        def on_post_bulk_delete(sender, ids, **kwargs):
+            counts.append(Article.objects.count())
+
+        # signals are sent once every chunk is deleted
+        post_bulk_delete.connect(on_post_bulk_delete, sender=Article)
+        try:
+            Article.objects.filter(pk__in=[1, 2, 3]).delete()
+        finally:
+            post_bulk_delete.disconnect(on_post_bulk_delete, sender=Article)
+        self.assertEqual(counts, [1, 1])
+
+    def test_bulk_create(self):
+        signals = []
+
+        def on_post_bulk_create(sender, queryset, ids, **kwargs):
+            signals.append(ids)
+
+        post_bulk_create.connect(on_post_bulk_create, sender=Article)
+        try:
+            Article.objects.bulk_create([
+                Article(author_id=1, subject='bulk {0}'.format(i))
+                for i in range(3)] + [Article(pk=10, author_id=1)])
+        finally:
+            post_bulk_create.disconnect(on_post_bulk_create, sender=Article)
+
+        ids = list(Article.objects.filter(pk__gt=4).order_by('pk')
+                   .values_list('pk', flat=True))
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(sorted(sum(signals, [])), ids)
+        self.assertTrue(all(len(chunk) <= 2 for chunk in signals))
+
+    def test_delete(self):
+        # a single query finds there is nothing to delete, in a savepoint
+        # of the test transaction
+        with self.assertNumQueries(3):
+            Article.objects.filter(pk=0).delete()
+
+        Article.objects.filter(pk__in=[1, 2, 3]).delete()
+        self.assertEqual(list(Article.objects.values_list('pk', flat=True)),
+                         [4])
+
+        # a tombstone per deleted article
+        self.assertEqual(sorted(IndexTombstone.objects.values_list(
+            'object_id', flat=True)), ['1', '2', '3'])
+
+        # not kept without use_tombstones
+        M.use_tombstones = False
+        try:
+            Article.objects.all().delete()
+        finally:
+            M.use_tombstones = True
+        self.assertEqual(IndexTombstone.objects.count(), 3)
+
+    def test_bulk_delete_unindex(self):
+        with coalesce_indexing():
+            Article.objects.filter(pk__in=[1, 2, 3]).delete()
+            self.assertEqual(get_index_buffer().get_ids(M, 'unindex'),
+                             [1, 2, 3])
+
+    def test_delete_unindex_without_bulk_receiver(self):
+        # apps connecting post_delete only still unindex deleted objects
+        post_bulk_delete.disconnect(M.on_post_bulk_delete, sender=Article)
+        try:
+            with coalesce_indexing():
+                Article.objects.filter(pk__in=[1, 2, 3]).delete()
+                self.assertEqual(
+                    sorted(get_index_buffer().get_ids(M, 'unindex')),
+                    [1, 2, 3])
+        finally:
+            post_bulk_delete.connect(M.on_post_bulk_delete, sender=Article)
+
+
+class HydrationTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def test_hydrate(self):
+        with self.assertNumQueries(1):
+            objects, missing = M.hydrate(['3', '1', '42', '2'])
+        self.assertEqual([a.pk for a in objects], [3, 1, 2])
+        self.assertEqual(missing, ['42'])
+
+        self.assertEqual(M.hydrate([]), ([], []))
+
+    def test_hydrate_related(self):
+        class RelatedMappingType(M):
+            hydrate_select_related = ('author', )
+            hydrate_prefetch_related = ('contributors', )
+
+        with self.assertNumQueries(2):
+            objects, missing = RelatedMappingType.hydrate([1, 2])
+            self.assertEqual([a.author.username for a in objects],
+                             ['florent', 'louise'])
+            self.assertEqual([len(a.contributors.all()) for a in objects],
+                             [2, 0])
+
+
+@override_settings(ES_DISABLED=True)
+class HydrationCacheTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super(HydrationCacheTestCase, self).setUp()
+        M.hydration_cache = get_shared_cache(self)
+
+    def tearDown(self):
+        del M.hydration_cache
+        super(HydrationCacheTestCase, self).tearDown()
+
+    def test_hydration_cache(self):
+        objects, missing = M.hydrate(['1', '2'], versions=['v1', 'v1'])
+        with self.assertNumQueries(0):
+            cached, missing = M.hydrate(['2', '1'], versions=['v1', 'v1'])
+        self.assertEqual(cached, objects[::-1])
+
+        # newer version
+        with self.assertNumQueries(1):
+            objects, missing = M.hydrate(['1', '2'], versions=['v2', 'v1'])
+        self.assertEqual(objects[1], cached[0])
+        with self.assertNumQueries(0):
+            self.assertEqual(M.get_object_by_id('1', 'v2').pk, 1)
+
+        # invalidated by signals
+        Article.objects.get(pk=1).save()
+        Article.objects.filter(pk=2).update(status=3)
+        with self.assertNumQueries(1):
+            objects, missing = M.hydrate(['1', '2'], versions=['v2', 'v1'])
+        self.assertEqual(objects[1].status, 3)
+
+        Article.objects.filter(pk=2).delete()
+        self.assertRaises(Article.DoesNotExist, M.get_object_by_id, '2',
+                          'v1')
+
+        # without version, never cached
+        M.hydrate(['3'])
+        with self.assertNumQueries(1):
+            M.hydrate(['1', '3'], versions=['v2', None])
+        with self.assertNumQueries(1):
+            self.assertEqual(M.get_object_by_id('1').pk, 1)
+        self.assertIsNone(M.hydration_cache.get(
+            M.get_hydration_cache_key('3')))
+
+        # search results are hydrated with their version
+        result = M.from_results({'id': '1', 'updated_at': 'v2'})
+        result._id = '1'
+        with self.assertNumQueries(0):
+            self.assertEqual(result.get_object().pk, 1)
+
+    def test_hydration_cache_shared(self):
+        # not invalidated in other processes
+        M.hydration_cache = LRUCache()
+        self.assertRaises(ImproperlyConfigured, M.get_hydration_cache)
+
+    def test_lru_cache(self):
+        cache = LRUCache(max_size=2, timeout=10)
+        with freeze_time('2014-10-12 12:00:00'):
+            cache.set_many({'a': 1, 'b': 2})
+            self.assertEqual(cache.get('a'), 1)
+            # b is the least recently used
+            cache.set('c', 3)
+            self.assertEqual(cache.get_many(['a', 'b', 'c']),
+                             {'a': 1, 'c': 3})
+            cache.set('d', 4, timeout=60)
+
+        with freeze_time('2014-10-12 12:00:30'):
+            self.assertEqual(cache.get_many(['a', 'c', 'd']), {'d': 4})
+
+        # expired entries are dropped
+        self.assertEqual(len(cache), 1)
+        cache.delete('d')
+        self.assertEqual(len(cache), 0)
+
+
+class SearchCacheTestCase(TestCase):
+
+    def setUp(self):
+        super(SearchCacheTestCase, self).setUp()
+        M.search_cache = LRUCache()
+        M.search_cache_refresh_delay = 0
+        M.search_generation_cache = get_shared_cache(self)
+        es = FakeES()
+        self.searches = es.searches
+        self.S = get_fake_s(es)
+
+    def tearDown(self):
+        del M.search_cache
+        del M.search_cache_refresh_delay
+        del M.search_generation_cache
+        super(SearchCacheTestCase, self).tearDown()
+
+    def test_search_cache(self):
+        s = self.S(M).query(subject__match='amazing')
+        self.assertEqual(s.count(), 1)
+        self.assertEqual(s.count(), 1)
+        self.assertEqual(self.S(M).query(subject__match='amazing').count(), 1)
+        self.assertEqual(len(self.searches), 1)
+
+        # other query
+        self.assertEqual(s.filter(status=1).count(), 2)
+        self.assertEqual(len(self.searches), 2)
+
+        # written index
+        M.bump_write_generation()
+        self.assertEqual(s.count(), 3)
+        self.assertEqual(s.count(), 3)
+        self.assertEqual(len(self.searches), 3)
+
+    def test_search_cache_direct_writes(self):
+        es = FakeES()
+        s = self.S(M).query(subject__match='amazing')
+        self.assertEqual(s.count(), 1)
+
+        # Indexable.index and unindex invalidate cached searches
+        M.index({'id': 1}, id_=1, es=es)
+        self.assertEqual(s.count(), 2)
+        self.assertEqual(s.count(), 2)
+        M.unindex(1, es=es)
+        self.assertEqual(s.count(), 3)
+        self.assertEqual(len(es.indexed), 1)
+        self.assertEqual(len(es.deleted), 1)
+
+    def test_search_generation_cache(self):
+        # in process caches are not invalidated by worker writes
+        for cache in (LRUCache(), 'default'):
+            M.search_generation_cache = cache
+            self.assertRaises(ImproperlyConfigured,
+                              self.S(M).count)
+            self.assertRaises(ImproperlyConfigured, M.bump_write_generation)
+
+    def test_search_cache_refresh_delay(self):
+        M.search_cache_refresh_delay = 60
+        M.bump_write_generation()
+        s = self.S(M).query(subject__match='amazing')
+        self.assertEqual(s.count(), 1)
+        self.assertEqual(s.count(), 2)
+
+
+class SourceTestCase(TestCase):
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super(SourceTestCase, self).setUp()
+        doc = M.extract_document(1)
+        # dates are strings in the source
+        doc['created_at'] = '2014-10-16T16:19:20.909000+00:00'
+        self.result = decorate_with_metadata(M.from_results(doc),
+                                             {'_id': '1', '_source': doc})
+
+    def test_source_object(self):
+        created_at = Article.objects.get(pk=1).created_at
+        obj = self.result.get_source_object()
+        with self.assertNumQueries(0):
+            self.assertEqual((obj.pk, obj.id, obj.status), (1, 1, 0))
+            self.assertEqual(obj.created_at, created_at)
+            self.assertEqual(obj.author.username, 'florent')
+            self.assertEqual(obj.category.name, 'Some Category')
+            self.assertEqual(obj.serializable_value('category'), 1)
+
+        # not in the source, article and author are read
+        with self.assertNumQueries(2):
+            self.assertEqual(obj.author.language, 'fr')
+            self.assertEqual(obj.get_object().pk, 1)
+
+    def test_source_serializer(self):
+        with self.assertNumQueries(0):
+            data = ArticleSourceSerializer(self.result).data
+        self.assertEqual(data['id'], 1)
+        self.assertEqual(data['subject'], 'My subject 1')
+        self.assertEqual(data['category'], 1)
+        self.assertEqual(data['created_at'],
+                         ArticleSourceSerializer(
+                             Article.objects.get(pk=1)).data['created_at'])
+
+
+class FilterSetTestCase(TestCase):
+
+    def setUp(self):
+        super(FilterSetTestCase, self).setUp()
+        es = FakeES(hits=[{'_id': str(i), '_source': {'id': str(i)}}
+                          for i in range(1, 26)], total=25)
+        self.searches = es.searches
+        self.S = get_fake_s(es)
+
+    def get_filter_set(self, **search_terms):
+        return ElasticutilsFilterSet(search_fields=['subject', 'status'],
+                                     search_terms=search_terms,
+                                     mapping_type=M,
+                                     queryset=self.S(M))
+
+    def test_execute(self):
+        filter_set = self.get_filter_set(subject='amazing')
+        self.assertTrue(filter_set.qs is filter_set.qs)
+
+        results = filter_set.execute(10, 20)
+        self.assertEqual([r._id for r in results],
+                         [str(i) for i in range(11, 21)])
+        self.assertEqual(results.count, 25)
+        self.assertEqual((filter_set.count, len(filter_set)), (25, 25))
+        self.assertEqual(len(self.searches), 1)
+
+    def test_get_query(self):
+        query = self.S(M).filter(status=1)
+        filter_set = ElasticutilsFilterSet(
+            search_fields=['subject', 'status'],
+            search_terms={'subject': 'amazing', 'ids': ['1', '2'],
+                          'contributors': ['louise', 'florent'],
+                          'content': 'ignored'},
+            mapping_type=M,
+            queryset=query)
+
+        # a single filter, queryset filters first
+        self.assertEqual(filter_set.qs.build_search()['filter'], {'bool': {
+            'must': [
+                {'term': {'status': 1}},
+                {'term': {'subject': 'amazing'}},
+                filter_set._get_filter_nested_item('contributors', 'louise'),
+                filter_set._get_filter_nested_item('contributors', 'florent'),
+                filter_set.get_filter_ids(['1', '2'])]}})
+
+        filter_set = ElasticutilsFilterSet(search_fields=['subject'],
+                                           search_terms={'q': 'amaz'},
+                                           mapping_type=M,
+                                           queryset=self.S(M))
+        self.assertEqual(filter_set.qs.build_search()['filter'],
+                         filter_set.get_filter_all('amaz'))
+
+    def test_filter_context(self):
+        filter_set = ElasticutilsFilterSet(
+            search_fields=['status'],
+            search_terms={'status': 1, 'q': 'Amaz', 'contributors': None},
+            mapping_type=M,
+            queryset=self.S(M),
+            filter_cache={'status': True, 'q': False})
+
+        self.assertEqual(filter_set.qs.build_search()['filter'], {'bool': {
+            'must': [
+                {'bool': {'must': [{'term': {'status': 1}}],
+                          '_cache': True}},
+                {'bool': {'must_not': {'nested': {
+                    'path': 'contributors',
+                    'filter': {'match_all': {}}}}}},
+                {'bool': {'should': [{'term': {'_all': 'amaz'}},
+                                     {'prefix': {'_all': 'amaz'}}],
+                          '_cache': False}}]}})
+
+        self.assertEqual(
+            filter_set._get_filter_nested_item('contributors', 'louise'),
+            {'nested': {'path': 'contributors', 'filter': {'bool': {
+                'should': [{'term': {'contributors.username': 'louise'}},
+                           {'term': {'contributors.id': 'louise'}}]}}}})
+
+    def test_filter_nested_types(self):
+        class TypedMappingType(M):
+            _nested_fields = None
+            _nested_field_types = None
+
+            @classmethod
+            def get_field_mapping(cls):
+                return {'contributors': {'type': 'nested', 'properties': {
+                    'id': {'type': 'integer'},
+                    'username': {'type': 'string'},
+                    'joined_at': {'type': 'date'}}}}
+
+        self.assertEqual(TypedMappingType.get_nested_field_types(),
+                         {'contributors': {'integer': ['id'],
+                                           'date': ['joined_at'],
+                                           'string': ['username']}})
+
+        filter_set = ElasticutilsFilterSet(
+            search_terms={'contributors': ['1', 'louise', '2015-04-28']},
+            mapping_type=TypedMappingType,
+            queryset=self.S(TypedMappingType))
+        self.assertEqual(
+            [nested['nested']['filter']['bool']['should']
+             for nested in filter_set.get_filter_nested(
+                 'contributors', ['1', 'louise', '2015-04-28'])],
+            [[{'term': {'contributors.id': '1'}},
+              {'term': {'contributors.username': '1'}}],
+             [{'term': {'contributors.username': 'louise'}}],
+             [{'term': {'contributors.joined_at': '2015-04-28'}},
+              {'term': {'contributors.username': '2015-04-28'}}]])
+
+        # any of the terms, a single nested filter
+        filter_set = ElasticutilsFilterSet(
+            search_actions={'contributors': 'in'},
+            search_terms={'contributors': ['1', 'louise', '']},
+            mapping_type=TypedMappingType,
+            queryset=self.S(TypedMappingType))
+        self.assertEqual(filter_set.qs.build_search()['filter'], {
+            'nested': {'path': 'contributors', 'filter': {'bool': {
+                'should': [
+                    {'terms': {'contributors.id': ['1']}},
+                    {'terms': {'contributors.username': ['1', 'louise']}}
+                ]}}}})
+
+    def test_filter_ids(self):
+        self.assertEqual(clean_ids(['1', 2, '', 'pouet', '-1', None]), [1, 2])
+        self.assertEqual(clean_ids('1,2'), [1, 2])
+
+        es = FakeES()
+        stored = es.indexed
+
+        class SelectionMappingType(M):
+            selection_threshold = 2
+
+            @classmethod
+            def get_es(cls, **kwargs):
+                return es
+
+        # no selection unless enabled
+        filter_set = ElasticutilsFilterSet(mapping_type=SelectionMappingType,
+                                           queryset=self.S(M))
+        self.assertEqual(filter_set.get_filter_ids(['3', '1', '2']),
+                         {'ids': {'values': [3, 1, 2]}})
+        self.assertEqual(stored, [])
+
+        filter_set = ElasticutilsFilterSet(mapping_type=SelectionMappingType,
+                                           queryset=self.S(M),
+                                           selection=True)
+        self.assertEqual(filter_set.get_filter_ids(['1', '2']),
+                         {'ids': {'values': [1, 2]}})
+
+        # stored once, in an index of expiring documents
+        for i in range(2):
+            ids_filter = filter_set.get_filter_ids(['3', '1', '2', '1'])
+        self.assertEqual(len(stored), 1)
+        self.assertEqual(es.indices.created, [
+            ('demo_esutils_selections',
+             {'mappings': SelectionMappingType.get_selection_mapping()})])
+        self.assertEqual(SelectionMappingType.get_selection_mapping()[
+            'selection']['_ttl'], {'enabled': True, 'default': '1d'})
+
+        # stored again once expired
+        SelectionMappingType.selection_cache_timeout = 0
+        for i in range(2):
+            filter_set.get_filter_ids(['3', '4', '5'])
+        self.assertEqual(len(stored), 3)
+        index, doc_type, body, selection_id = stored[0]
+        self.assertEqual((index, doc_type, body),
+                         ('demo_esutils_selections', 'selection',
+                          {'ids': ['1', '2', '3']}))
+        self.assertEqual(ids_filter, {'terms': {'_id': {
+            'index': 'demo_esutils_selections',
+            'type': 'selection',
+            'id': selection_id,
+            'path': 'ids'}}})
+
+        filter_set = ElasticutilsFilterSet(
+            search_terms={'selection': selection_id},
+            mapping_type=SelectionMappingType,
+            queryset=self.S(M), selection=True)
+        self.assertEqual(filter_set.qs.build_search()['filter'], ids_filter)
+
+    def test_autocomplete(self):
+        class AutocompleteMappingType(M):
+            autocomplete_fields = ('subject', 'category.name', 'library.name')
+
+        properties = AutocompleteMappingType.get_mapping()['properties']
+        self.assertEqual(properties['subject']['copy_to'], 'autocomplete')
+        self.assertEqual(properties['category.name']['copy_to'],
+                         'autocomplete')
+        self.assertEqual(
+            properties['library']['properties']['name']['copy_to'],
+            'autocomplete')
+        self.assertEqual(properties['autocomplete']['index_analyzer'],
+                         'esutils_autocomplete')
+        self.assertFalse('copy_to' in M.get_mapping()['properties']['subject'])
+
+        analysis = AutocompleteMappingType.get_index_settings()['index'][
+            'analysis']
+        self.assertTrue('ngram_analyzer' in analysis['analyzer'])
+        self.assertTrue('esutils_autocomplete' in analysis['analyzer'])
+        self.assertTrue('esutils_autocomplete' in analysis['filter'])
+        # words longer than ngrams are truncated when searched
+        self.assertEqual(
+            analysis['filter']['esutils_autocomplete_truncate']['length'], 20)
+        self.assertEqual(
+            analysis['analyzer']['esutils_autocomplete_search']['filter'],
+            ['lowercase', 'esutils_autocomplete_truncate'])
+        self.assertFalse('esutils_autocomplete' in
+                         M.get_index_settings()['index']['analysis']['filter'])
+
+        filter_set = ElasticutilsFilterSet(
+            search_terms={'q': 'Amaz art'},
+            mapping_type=AutocompleteMappingType, queryset=self.S(M))
+        self.assertEqual(filter_set.qs.build_search()['filter'], {
+            'query': {'match': {'autocomplete': {'query': 'Amaz art',
+                                                 'operator': 'and'}}}})
+
+        filter_set = ElasticutilsFilterSet(
+            search_terms={'q': 'Amaz'},
+            mapping_type=AutocompleteMappingType, queryset=self.S(M),
+            autocomplete=False)
+        self.assertEqual(filter_set.qs.build_search()['filter'],
+                         filter_set.get_filter_all('amaz'))
+
+    def test_search_terms(self):
+        view = ArticleRestListView()
+        search_fields = list(view.search_fields)
+        backend = ElasticutilsFilterBackend()
+        request = Request(RequestFactory().get(
+            '/', {'subject': 'amazing', 'contributors[]': ['1', '2'],
+                  'library.name': '', 'q': 'amaz', 'unknown': 'yo'}))
+
+        self.assertEqual(backend.get_search_terms(request, view), {
+            'subject': 'amazing', 'contributors': ['1', '2'],
+            'library.name': '', 'q': 'amaz'})
+
+        search_keys = backend.get_search_keys(view)
+        self.assertTrue(search_keys is backend.get_search_keys(view))
+        self.assertEqual(search_keys[:len(search_fields) + 2],
+                         tuple(search_fields) + ('q', 'ids'))
+        self.assertFalse('selection' in search_keys)
+        self.assertTrue('library.name' in search_keys)
+        self.assertEqual(view.search_fields, search_fields)
+
+        # configured per view instance
+        view = ArticleRestListView(search_fields=['status'], all_filter='all',
+                                   query_filter='query', selection=True)
+        self.assertEqual(backend.get_search_keys(view)[:5],
+                         ('status', 'all', 'ids', 'selection', 'query'))
+
+    def test_query_string(self):
+        self.assertEqual(
+            parse_query_string('amaz -status:[1 TO *] subject:"a \\"b\\""'),
+            [Term(None, 'amaz', None, False),
+             Term('status', {'gte': '1'}, 'range', True),
+             Term('subject', 'a "b"', None, False)])
+        self.assertEqual(parse_query_string('url:http://a.b status:{1 TO 2]'),
+                         [Term('url', 'http://a.b', None, False),
+                          Term('status', {'gt': '1', 'lte': '2'}, 'range',
+                               False)])
+        self.assertEqual(parse_query_string('status:<=2'),
+                         [Term('status', {'lte': '2'}, 'range', False)])
+        for query_str in ('status:[1 TO 2', 'a:"b', 'a:b:c d:e:f x:y:z ]:',
+                          'status:[* TO *]', 'amaz:'):
+            self.assertRaises(QueryStringError, parse_query_string,
+                              query_str)
+
+        filter_set = ElasticutilsFilterSet(
+            search_fields=['subject', 'status'],
+            search_terms={'query': ' amaz -status:>1 content:yo '
+                                   'contributors:"" '},
+            mapping_type=M,
+            queryset=self.S(M),
+            query_filter='query')
+        query_filter = filter_set.qs.build_search()['filter']
+        self.assertEqual(query_filter, {'bool': {'must': [
+            filter_set.get_filter_all('amaz'),
+            {'bool': {'must_not': {'range': {'status': {'gt': '1'}}}}},
+            filter_set.get_filter_nested_missing('contributors')]}})
+
+        # compiled once
+        filter_set.compile_query_string = None
+        self.assertTrue(filter_set.get_filter_query_string(
+            self.S(M), 'amaz -status:>1 content:yo contributors:""')
+            is query_filter)
+
+        # compiled per filter set class
+        class OverriddenFilterSet(ElasticutilsFilterSet):
+            def get_filter(self, f, term):
+                return super(OverriddenFilterSet, self).get_filter(
+                    f, 'overridden')
+
+        filter_sets = [
+            filter_set_class(search_fields=['subject', 'status'],
+                             mapping_type=M, queryset=self.S(M),
+                             query_filter='query')
+            for filter_set_class in (ElasticutilsFilterSet,
+                                     OverriddenFilterSet)]
+        self.assertEqual(
+            [f.get_filter_query_string(self.S(M), 'status:1')
+             for f in filter_sets],
+            [{'term': {'status': '1'}}, {'term': {'status': 'overridden'}}])
+
+        backend = ElasticutilsFilterBackend()
+        self.assertEqual(backend.split_query_str('helo world'),
+                         {'_all': 'helo world'})
+        self.assertEqual(
+            backend.split_query_str('firstname:bob lastname:"bob dylan"'),
+            {'firstname': 'bob', 'lastname': 'bob dylan'})
+
+    def test_search_paginator(self):
+        paginator = SearchPaginator(self.get_filter_set(status=1), 10)
+        page = paginator.page(3)
+        self.assertEqual(len(page), 5)
+        self.assertEqual((paginator.count, paginator.num_pages), (25, 3))
+        self.assertEqual(len(self.searches), 1)
+
+        # orphans are on the last page
+        paginator = SearchPaginator(self.S(M), 10, orphans=5)
+        self.assertEqual(len(paginator.page(1)), 10)
+        paginator = SearchPaginator(self.S(M), 10, orphans=5)
+        self.assertEqual(len(paginator.page(2)), 15)
+        self.assertRaises(EmptyPage, SearchPaginator(self.S(M), 10).page, 4)
+        self.assertRaises(PageNotAnInteger, paginator.page, 'x')
+
+    def test_paginate_queryset(self):
+        view = ListAPIView(paginator_class=SearchPaginator, paginate_by=10,
+                           kwargs={})
+        view.request = Request(RequestFactory().get('/', {'page': 2}))
+
+        page = view.paginate_queryset(self.S(M))
+        self.assertEqual([r._id for r in page.object_list],
+                         [str(i) for i in range(11, 21)])
+        self.assertEqual(page.paginator.count, 25)
+        self.assertEqual(len(self.searches), 1)
+
+        view.request = Request(RequestFactory().get('/', {'page': 4}))
+        self.assertRaises(Http404, view.paginate_queryset, self.S(M))
+
+
+class BulkTestCase(TestCase):
+
+    def test_chunk_bodies(self):
+        es = M.get_es()
+        actions = [({'index': {'_id': i}}, {'id': i}) for i in range(5)]
+
+        bodies = list(chunk_bodies(es, actions, max_docs=2))
+        self.assertEqual(len(bodies), 3)
+        self.assertEqual(''.join(bodies),
+                         ''.join(bulk_lines(es, *a) for a in actions))
+
+        # bytes limit
+        max_bytes = len(bulk_lines(es, *actions[0])) * 2
+        bodies = list(chunk_bodies(es, actions, max_docs=10,
+                                   max_bytes=max_bytes))
+        self.assertEqual(len(bodies), 3)
+
+        # too big actions are sent alone
+        bodies = list(chunk_bodies(es, actions, max_docs=10, max_bytes=1))
+        self.assertEqual(len(bodies), 5)
+
+        # deletions have no source line
+        bodies = list(chunk_bodies(es, [({'delete': {'_id': 1}}, None)]))
+        self.assertEqual(bodies, ['{"delete": {"_id": 1}}\n'])
+
+
 class MappingTestCase(BaseTest):
 
+    def test_bulk_index(self):
+        prev_count = M.count()
+
+        result = M.bulk_unindex_ids([1, 2])
+        self.assertEqual((result.success, result.requests), (2, 1))
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count - 2)
+
+        result = M.bulk_index_ids([1, 2])
+        self.assertEqual((result.success, result.requests), (2, 1))
+        self.assertEqual(result.errors, [])
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count)
+
+    def test_run_index_streaming(self):
+        prev_count = M.count()
+        M.bulk_unindex_ids([1, 2, 3, 4])
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count - 4)
+
+        M.bulk_max_docs = 1
+        try:
+            result = M.run_index_streaming(chunk_size=3, in_flight=2)
+        finally:
+            del M.bulk_max_docs
+        self.assertEqual((result.success, result.requests), (4, 4))
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count)
+
+    def test_rebuild_index(self):
+        prev_count = M.count()
+        es = M.get_es()
+
+        index = M.rebuild_index()
+        try:
+            self.assertEqual(M.get_aliased_indexes(), [index])
+            self.assertEqual(M.count(), prev_count)
+
+            # previous index is deleted once the alias moved
+            new_index = M.rebuild_index()
+            self.assertEqual(M.get_aliased_indexes(), [new_index])
+            self.assertFalse(es.indices.exists(index))
+            self.assertEqual(M.count(), prev_count)
+        finally:
+            for i in M.get_aliased_indexes():
+                es.indices.delete(i)
+
+    def test_autocomplete_long_word(self):
+        class AutocompleteMappingType(M):
+            autocomplete_fields = ('subject', )
+
+        es = M.get_es()
+        index = AutocompleteMappingType.get_versioned_index()
+        AutocompleteMappingType.create_index(
+            es=es, index=index,
+            index_settings=AutocompleteMappingType.get_index_settings())
+        try:
+            def analyze(analyzer):
+                return set(t['token'] for t in es.indices.analyze(
+                    index=index, analyzer=analyzer,
+                    text='Supercalifragilisticexpialidocious')['tokens'])
+
+            # the searched word matches the longest indexed ngram
+            self.assertEqual(analyze('esutils_autocomplete_search'),
+                             set(['supercalifragilistic']))
+            self.assertTrue(analyze('esutils_autocomplete_search') <=
+                            analyze('esutils_autocomplete'))
+        finally:
+            es.indices.delete(index)
+
+    def test_rebuild_index_replay(self):
+        es = M.get_es()
+        run_index_streaming = M.run_index_streaming
+
+        def load(**kwargs):
+            result = run_index_streaming(**kwargs)
+            # modified after its row was loaded
+            Article.objects.filter(pk=2).update(subject='replayed',
+                                                updated_at=now())
+            return result
+
+        M.run_index_streaming = staticmethod(load)
+        try:
+            M.rebuild_index()
+            del M.run_index_streaming
+            self.assertEqual(M.query(subject__match='replayed').count(), 1)
+        finally:
+            if 'run_index_streaming' in M.__dict__:
+                del M.run_index_streaming
+            for i in M.get_aliased_indexes():
+                es.indices.delete(i)
+
+    def test_rebuild_index_replay_swap(self):
+        es = M.get_es()
+        swapping = []
+
+        def get_serving_index_settings(cls):
+            # modified after the first replay
+            Article.objects.filter(pk=2).update(subject='serving',
+                                                updated_at=now())
+            return SearchMappingType.get_serving_index_settings.__func__(
+                cls)
+
+        def get_aliased_indexes(cls, **kwargs):
+            # modified while the alias moves, sent to the previous index
+            if not swapping:
+                swapping.append(True)
+                Article.objects.filter(pk=3).update(subject='swapping',
+                                                    updated_at=now())
+            return SearchMappingType.get_aliased_indexes.__func__(
+                cls, **kwargs)
+
+        M.get_serving_index_settings = classmethod(get_serving_index_settings)
+        M.get_aliased_indexes = classmethod(get_aliased_indexes)
+        try:
+            M.rebuild_index()
+            M.refresh_index()
+            self.assertEqual(M.query(subject__match='serving').count(), 1)
+            self.assertEqual(M.query(subject__match='swapping').count(), 1)
+        finally:
+            del M.get_serving_index_settings
+            del M.get_aliased_indexes
+            for i in M.get_aliased_indexes():
+                es.indices.delete(i)
+
+    def test_run_index_delta(self):
+        prev_count = M.count()
+        M.run_index_delta()
+
+        # updated while indexing was down
+        Article.objects.filter(pk=2).update(subject='delta')
+        M.bulk_unindex_ids([2])
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count - 1)
+
+        M.run_index_delta()
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count)
+        self.assertEqual(M.query(subject__match='delta').count(), 1)
+
+    def test_coalesce_indexing(self):
+        prev_count = M.count()
+
+        with coalesce_indexing():
+            Article.objects.get(pk=1).delete()
+            M.refresh_index()
+            # not sent yet
+            self.assertEqual(M.count(), prev_count)
+
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count - 1)
+
+    def test_outbox(self):
+        prev_count = M.count()
+        M.use_outbox = True
+        try:
+            Article.objects.get(pk=1).delete()
+            M.refresh_index()
+            self.assertEqual(M.count(), prev_count)
+
+            count, result = drain_outbox()
+            self.assertEqual((count, result.success), (1, 1))
+        finally:
+            del M.use_outbox
+
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count - 1)
+
+    def test_queryset_partial_update(self):
+        self.assertEqual(M.query(status=3).count(), 1)
+        M.bulk_unindex_ids([2])
+        M.refresh_index()
+
+        Article.objects.filter(pk__in=[1, 2]).update(status=3)
+        M.refresh_index()
+
+        # missing document is indexed, other values are kept
+        self.assertEqual(sorted(int(r._id) for r in M.query(status=3)),
+                         [1, 2, 4])
+        self.assertEqual(M.query(subject__match='subject', status=3).count(),
+                         2)
+
+        result = M.bulk_update_ids([2, 3], {'status': 0})
+        self.assertEqual((result.success, result.errors), (2, []))
+
+    def test_queryset_bulk_create_delete(self):
+        prev_count = M.count()
+
+        Article.objects.bulk_create([
+            Article(author=self.louise, subject='bulk {0}'.format(i))
+            for i in range(3)])
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count + 3)
+        self.assertEqual(M.query(subject__match='bulk').count(), 3)
+
+        Article.objects.filter(subject__startswith='bulk').delete()
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count)
+
+    def test_search_all(self):
+        ids = [int(r._id) for r in M.query().order_by('-id')]
+
+        with self.assertNumQueries(1):
+            objects = list(M.query().order_by('-id').all())
+        self.assertEqual([a.pk for a in objects], ids)
+
+        # missing from the database, deleted without signals
+        Article.objects.filter(pk=ids[0])._raw_delete(using='default')
+        self.assertEqual([a.pk for a in M.query().order_by('-id').all()],
+                         ids[1:])
+
+    def test_search_cache(self):
+        M.search_cache = LRUCache()
+        M.search_cache_refresh_delay = 0
+        M.search_generation_cache = get_shared_cache(self)
+        try:
+            count = M.count()
+            self.assertEqual(M.count(), count)
+
+            # invalidated by writes
+            M.bulk_unindex_ids([1])
+            M.refresh_index()
+            self.assertEqual(M.count(), count - 1)
+        finally:
+            del M.search_cache
+            del M.search_cache_refresh_delay
+            del M.search_generation_cache
+
+    def test_run_index_partitioned(self):
+        prev_count = M.count()
+        M.bulk_unindex_ids([1, 2, 3, 4])
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count - 4)
+
+        M.run_index_partitioned(partitions=2, number=1, backend='celery')
+        M.refresh_index()
+        self.assertEqual(M.count(), prev_count)
+
     def test_index(self):
 
         # keep previous indexed objec count
@@ -531,3 +1903,28 @@ class ViewBackendTestCase(BaseTest):
     def test_all_exact_word(self):
         response = self.client.get(reverse('rest_article_list')+'?q=amazing')
         self.assertEqual(len(response.data), 1)
+
+    def test_query_string(self):
+        url = reverse('rest_article_list')
+        response = self.client.get(url, {'query': 'status:>0'})
+        self.assertEqual(len(response.data), 3)
+        response = self.client.get(url, {'query': 'status:[2 TO 3] amaz'})
+        self.assertEqual(len(response.data), 1)
+        response = self.client.get(url, {'query': 'status:>0 -amaz'})
+        self.assertEqual(len(response.data), 2)
+        response = self.client.get(url, {'query': 'status:[0 TO 1'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_source_mode(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('source_rest_list'))
+        self.assertEqual(
+            sorted((d['id'], d['subject']) for d in response.data),
+            list(Article.objects.order_by('pk').values_list('pk',
+                                                            'subject')))
+
+    def test_hydration(self):
+        # a single query for all the results
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('rest_article_list'))
+        self.assertEqual(len(response.data), 4)
@@ -12,6 +12,8 @@ from django_esutils.mappings import SearchMappingType
 
 from django_esutils.filters import ElasticutilsFilterSet
 from django_esutils.filters import ElasticutilsFilterBackend
+from django_esutils.serializers import SourceSerializer
+from django_esutils.views import SearchListMixin
 
 
 class ArticleSerializer(serializers.ModelSerializer):
@@ -30,6 +32,17 @@ class ArticleSerializer(serializers.ModelSerializer):
         return getlist(dictionary, key)
 
 
+class ArticleSourceSerializer(SourceSerializer):
+    class Meta:
+        model = Article
+        fields = ['id',
+                  'subject',
+                  'content',
+                  'status',
+                  'category',
+                  'created_at']
+
+
 class BaseArticleListView(object):
 
     model = Article
@@ -48,6 +61,7 @@ class BaseArticleListView(object):
                      'status',
                      'contributors',
                      'library']
+    query_filter = 'query'
 
     def get_queryset(self):
         # detail views
@@ -67,10 +81,17 @@ class ArticleListView(BaseArticleListView, ListView):
         return queryset
 
 
-class ArticleRestListView(BaseArticleListView, ListAPIView):
+class ArticleRestListView(SearchListMixin, BaseArticleListView, ListAPIView):
     serializer_class = ArticleSerializer
 
 
-class ArticleRestListView2(BaseArticleListView, ListAPIView):
+class ArticleRestListView2(SearchListMixin, BaseArticleListView,
+                           ListAPIView):
     serializer_class = ArticleSerializer
     all_filter = 'trololo'
+
+
+class ArticleRestSourceListView(SearchListMixin, BaseArticleListView,
+                                ListAPIView):
+    serializer_class = ArticleSourceSerializer
+    source_mode = True
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Elasticsearch ``_bulk`` helpers sending bounded requests."""
+import logging
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+
+log = logging.getLogger('django_esutils')
+
+
+class BulkResult(object):
+    """Summary of bulk requests.
+
+    :attr success: number of succeeded items.
+    :attr errors: list of failed items as ``{op_type: item}`` dicts, as
+        returned by Elasticsearch.
+    :attr requests: number of HTTP requests sent.
+    """
+
+    def __init__(self):
+        self.success = 0
+        self.errors = []
+        self.requests = 0
+
+    def __repr__(self):
+        return '<BulkResult: {0} success, {1} errors, {2} requests>'.format(
+            self.success, len(self.errors), self.requests)
+
+    def update(self, other):
+        self.success += other.success
+        self.errors.extend(other.errors)
+        self.requests += other.requests
+        return self
+
+
+def bulk_lines(es, action, source=None):
+    """Returns serialized bulk lines of an action and its optional source.
+
+    ..code-block: python
+
+        >>> bulk_lines(es, {'index': {'_id': 1}}, {'id': 1})
+        '{"index": {"_id": 1}}\\n{"id": 1}\\n'
+    """
+    dumps = es.transport.serializer.dumps
+    lines = dumps(action) + '\n'
+    if source is not None:
+        lines += dumps(source) + '\n'
+    return lines
+
+
+def chunk_bodies(es, actions, max_docs=500, max_bytes=None):
+    """Yields bulk bodies of at most max_docs actions and max_bytes bytes.
+
+    An action bigger than max_bytes alone is sent in its own body.
+
+    :params actions: iterable of ``(action, source)``, source being None for
+        deletions.
+    """
+    body, size, count = [], 0, 0
+    for action, source in actions:
+        lines = bulk_lines(es, action, source)
+        if count and (count >= max_docs or
+                      (max_bytes and size + len(lines) > max_bytes)):
+            yield ''.join(body)
+            body, size, count = [], 0, 0
+        body.append(lines)
+        size += len(lines)
+        count += 1
+    if body:
+        yield ''.join(body)
+
+
+def is_success(op_type, item):
+    """Returns True if a bulk item succeeded, deleting a missing document
+    is a success."""
+    status = item.get('status', 500)
+    if op_type == 'delete' and status == 404:
+        return True
+    return 200 <= status < 300
+
+
+def get_failed_ids(result, status=None):
+    """Returns the ids of the failed items of a `BulkResult`.
+
+    :params status: only items failed with this HTTP status, ex.: 404.
+    """
+    return set(str(item['_id'])
+               for entry in result.errors for item in entry.values()
+               if status is None or item.get('status') == status)
+
+
+def send_bulk(es, body, index=None, doc_type=None):
+    """Sends a bulk body and returns its `BulkResult`.
+
+    Failed items are reported, not raised, so that callers may retry them
+    without resending the whole body.
+    """
+    result = BulkResult()
+    response = es.bulk(body, index=index, doc_type=doc_type)
+    result.requests += 1
+    for entry in response.get('items', []):
+        op_type, item = list(entry.items())[0]
+        if is_success(op_type, item):
+            result.success += 1
+        else:
+            result.errors.append(entry)
+    if result.errors:
+        log.error('{0} bulk item(s) failed on {1}/{2}: {3}'.format(
+            len(result.errors), index, doc_type, result.errors[:10]))
+    return result
+
+
+def streaming_bulk(es, actions, index=None, doc_type=None, max_docs=500,
+                   max_bytes=None, in_flight=1):
+    """Streams actions to Elasticsearch by bounded bulk requests.
+
+    :params actions: iterable of ``(action, source)``, ex.:
+        ``({'index': {'_id': '1'}}, {'id': '1'})``.
+    :params max_docs: max number of actions per request.
+    :params max_bytes: max size of a request body.
+    :params in_flight: max number of requests sent concurrently, actions
+        being consumed while they are sent.
+
+    Returns the `BulkResult` of all the requests.
+    """
+    result = BulkResult()
+    bodies = chunk_bodies(es, actions, max_docs, max_bytes)
+
+    if in_flight <= 1:
+        for body in bodies:
+            result.update(send_bulk(es, body, index=index, doc_type=doc_type))
+        return result
+
+    pool = ThreadPool(in_flight)
+    pending = deque()
+    try:
+        for body in bodies:
+            # wait for the oldest request to bound pending bodies
+            if len(pending) >= in_flight:
+                result.update(pending.popleft().get())
+            pending.append(pool.apply_async(
+                send_bulk, (es, body), {'index': index, 'doc_type': doc_type}))
+        while pending:
+            result.update(pending.popleft().get())
+    finally:
+        pool.close()
+        pool.join()
+    return result
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Caches of `SearchMappingType` hydration and search results."""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import six
+
+try:
+    from django.core.cache import caches
+
+    def get_cache(alias):
+        return caches[alias]
+except ImportError:  # Django < 1.7
+    from django.core.cache import get_cache  # noqa
+
+
+class LRUCache(object):
+    """In process cache of at most max_size entries, expiring after timeout
+    seconds, the least recently used entries being evicted first.
+
+    Implements the `get_many`, `set_many` and `delete_many` methods of Django
+    caches, a None timeout never expires. Values are not copied: cached
+    objects are shared by the callers of a process.
+    """
+
+    def __init__(self, max_size=1000, timeout=300):
+        self.max_size = max_size
+        self.timeout = timeout
+        # key -> (expiration time or None, value), oldest used first
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.pop(key, None)
+                if entry is None or \
+                        (entry[0] is not None and entry[0] <= now):
+                    continue
+                # most recently used
+                self._data[key] = entry
+                found[key] = entry[1]
+        return found
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        expires = None if timeout is None else time.time() + timeout
+        with self._lock:
+            for key, value in data.items():
+                self._data.pop(key, None)
+                self._data[key] = (expires, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.set_many({key: value}, timeout=timeout)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def resolve_cache(cache):
+    """Returns the Django cache of an alias, or cache itself."""
+    if isinstance(cache, six.string_types):
+        return get_cache(cache)
+    return cache
+
+
+def is_process_local(cache):
+    """Returns True if cache is not shared by processes."""
+    return isinstance(cache, (LRUCache, LocMemCache))
+
+
+def get_search_key(body):
+    """Returns a stable cache key of a search, ex.: of a list of its
+    `build_search()`, indexes and doc types."""
+    body = json.dumps(body, sort_keys=True, default=str)
+    return 'django_esutils:search:{0}'.format(
+        hashlib.sha1(body.encode('utf-8')).hexdigest())
+
+
+def get_generation_key(index):
+    return 'django_esutils:generation:{0}'.format(index)
+
+
+def bump_generations(cache, indexes):
+    """Sets the write generation of indexes, the time of their last write.
+
+    Search responses cached with other generations are not served anymore.
+    """
+    cache.set_many(dict((get_generation_key(index), time.time())
+                        for index in indexes), None)
+
+
+def get_cached_search(cache, key, indexes, generation_cache):
+    """Returns ``(response or None, generations)``: the cached response of
+    the search key if cached with the current write generations of indexes,
+    read from generation_cache.
+
+    Generations of indexes never written, or evicted, are initialized to
+    the current time: responses are never cached without generation and
+    never served after their generation has been lost.
+    """
+    generation_keys = [get_generation_key(index) for index in indexes]
+    cached = generation_cache.get_many(generation_keys)
+
+    missing = dict((k, time.time()) for k in generation_keys
+                   if k not in cached)
+    if missing:
+        generation_cache.set_many(missing, None)
+        cached.update(missing)
+    generations = [cached[k] for k in generation_keys]
+
+    entry = cache.get(key)
+    if entry is not None and list(entry[0]) == generations:
+        return entry[1], generations
+    return None, generations
@@ -1,8 +1,28 @@
 # -*- coding: utf-8 -*-
+import re
+from collections import OrderedDict
+
+from django.utils import six
+from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_datetime
+
 from elasticutils import F
 
+from rest_framework.exceptions import ParseError
 from rest_framework.filters import SearchFilter
 
+from django_esutils.query_string import QueryStringError
+from django_esutils.query_string import parse_query_string
+from django_esutils.query_string import query_string_cache
+
+
+# bool filter occurrences of legacy connectors
+BOOL_OCCURS = {
+    'and': 'must',
+    'or': 'should',
+    'not': 'must_not',
+}
+
 
 def _F(path, field, term, action='term'):
     """Returns F with path:field for nested filtering.
@@ -16,33 +36,95 @@ def _F(path, field, term, action='term'):
     }
 
 
+# valid ids, ex.: of query params
+_ID_RE = re.compile(r'^[0-9]+$')
+
+
+def clean_ids(values):
+    """Returns the integer ids of values, invalid ones being dropped.
+
+    ..code-block: python
+
+        >>> clean_ids(['1', 2, '', 'pouet'])
+        [1, 2]
+        >>> clean_ids('1,2')
+        [1, 2]
+    """
+    if isinstance(values, six.string_types):
+        values = values.split(',')
+    return list(map(int, filter(_ID_RE.match, map(six.text_type, values))))
+
+
+def _is_date(term):
+    """Returns True if term is an ISO formatted date or datetime."""
+    if not isinstance(term, six.string_types):
+        return False
+    try:
+        return bool(parse_date(term) or parse_datetime(term))
+    except ValueError:
+        return False
+
+
+def _bool(occur, clauses, cache=None):
+    """Returns a bool filter of clauses, in filter context, which Elasticsearch
+    caches as bitsets, unlike and/or/not filters.
+
+    http://www.elasticsearch.org/guide/en/elasticsearch/reference/current/query-dsl-bool-filter.html  # noqa
+
+    :params occur: must, should or must_not, or the legacy and, or and not.
+    :params cache: ``_cache`` hint, Elasticsearch default if None.
+    """
+    bool_filter = {BOOL_OCCURS.get(occur, occur): clauses}
+    if cache is not None:
+        bool_filter['_cache'] = cache
+    return {'bool': bool_filter}
+
+
 class ElasticutilsFilterSet(object):
 
     def __init__(self, search_fields=None, search_actions=None,
                  search_terms=None, mapping_type=None, queryset=None,
-                 default_action='', all_filter='q', prefix_fields=None):
+                 default_action='', all_filter='q', prefix_fields=None,
+                 filter_cache=None, autocomplete=None, query_filter=None,
+                 selection=False):
 
         self.search_fields = search_fields or []
         self.search_actions = search_actions or {}
         self.search_terms = search_terms or {}
         self.all_filter = all_filter
         self.prefix_fields = prefix_fields or []
+        # search key -> ``_cache`` hint of its filters, ex.: {'status': True}
+        self.filter_cache = filter_cache or {}
+        # search key of query strings, see `get_filter_query_string`
+        self.query_filter = query_filter
+        # filter many ids by stored selection documents, an Elasticsearch
+        # write, and by the selection search key, see `get_ids_filter`
+        self.selection = selection
 
         self.mapping_type = mapping_type
+        # match the all filter on the autocomplete field instead of term and
+        # prefix filters on _all, default if the mapping type has one
+        if autocomplete is None:
+            autocomplete = bool(self.mapping_type.autocomplete_fields)
+        self.autocomplete = autocomplete
         self.nested_fields = self.mapping_type.get_nested_fields()
+        self.nested_field_types = self.mapping_type.get_nested_field_types()
         self.object_fields = self.mapping_type.get_object_fields()
 
-        self.raw_fields = [self.all_filter, 'ids'] + self.nested_fields.keys()
         self.queryset = queryset
 
         self.default_action = default_action
 
+        # compiled query and total number of hits, see `qs` and `execute`
+        self._qs = None
+        self._count = None
+
     def __iter__(self):
         for obj in self.qs:
             yield obj
 
     def __len__(self):
-        return self.count()
+        return self.count
 
     def __getitem__(self, key):
         return self.qs[key]
@@ -63,138 +145,290 @@ class ElasticutilsFilterSet(object):
             term = None
         return F(**{field_action: term})
 
-    def _get_filter_nested_item(self, f, term, action='or'):
+    def get_nested_term_fields(self, f, term):
+        """Returns the fields of the nested field f a term can match: integer
+        and string fields for an integer, date and string fields for a date,
+        string fields otherwise."""
+        types = self.nested_field_types[f]
+        try:
+            int(term)
+        except (TypeError, ValueError):
+            pass
+        else:
+            return types['integer'] + types['string']
+
+        if types['date'] and _is_date(term):
+            return types['date'] + types['string']
+        return types['string']
 
+    def get_filter_nested_missing(self, f):
         # The following is the research for missing nested relations
         # Like looking for a library (object) that has no books (nested)
-        if not term or term == '':
-            return {
-                'not': {
-                    'nested': {
-                        'path': f,
-                        'filter': {
-                            'match_all': {}
-                        }
-                    }
+        return _bool('must_not', {
+            'nested': {
+                'path': f,
+                'filter': {
+                    'match_all': {}
                 }
             }
+        })
 
-        fields = list(self.nested_fields.get(f))
+    def _get_filter_nested_item(self, f, term, action='or'):
+        if not term or term == '':
+            return self.get_filter_nested_missing(f)
 
-        is_int = True
-        try:
-            int(term)
-        except:
-            is_int = False
+        return {
+            'nested': {
+                'path': f,
+                'filter': _bool(action, [
+                    _F(f, nf, term)
+                    for nf in self.get_nested_term_fields(f, term)])
+            }
+        }
 
-        if not is_int:
-            mapping_fields = self.mapping_type.get_field_mapping()
-            for nf in fields:
-                if mapping_fields[f]['properties'][nf]['type'] == 'integer':
-                    fields.remove(nf)
+    def _get_filter_nested_in(self, f, terms):
+        # a single nested filter, terms of the values each field can match
+        values = OrderedDict()
+        for term in terms:
+            for nf in self.get_nested_term_fields(f, term):
+                values.setdefault(nf, []).append(term)
 
         return {
             'nested': {
                 'path': f,
-                'filter': {
-                    action: [_F(f, nf, term) for nf in fields]
-                }
+                'filter': _bool('should', [
+                    _F(f, nf, nf_terms, action='terms')
+                    for nf, nf_terms in values.items()])
             }
         }
 
     def get_filter_nested(self, f, terms):
+        """Returns the filters of the terms of the nested field f.
+
+        Objects are matched if they have a nested object matching each term,
+        or any term if the search action of f is ``in``. No term matches
+        objects without nested object.
+        """
+        if isinstance(terms, six.string_types):
+            terms = [terms]
+
+        if self.search_actions.get(f) == 'in':
+            terms = [t for t in terms or [] if t != '']
+            if not terms:
+                return [self.get_filter_nested_missing(f)]
+            return [self._get_filter_nested_in(f, terms)]
+
         if terms:
             return [self._get_filter_nested_item(f, t) for t in terms]  # noqa
 
         return [self._get_filter_nested_item(f, terms)]
 
     def get_filter_ids(self, values):
+        ids = clean_ids(values)
+        if self.selection:
+            return self.mapping_type.get_ids_filter(ids)
         return {
             'ids': {
-                'values': [int(i) for i in values if i and str(i).isdigit()]
+                'values': ids
             }
         }
 
+    def get_filter_selection(self, selection_id):
+        return self.mapping_type.get_selection_filter(selection_id)
+
     def get_filter_all(self, value):
+        if self.autocomplete:
+            return self.get_filter_autocomplete(value)
+        return _bool('should', [
+            {
+                'term': {
+                    '_all': value.lower()
+                }
+            },
+            {
+                'prefix': {
+                    '_all': value.lower()
+                }
+            }
+        ])
+
+    def get_filter_autocomplete(self, value):
+        """Returns a filter of the documents whose autocomplete field has
+        words starting with every word of value, see
+        `SearchMappingType.autocomplete_fields`."""
         return {
-            'or': [
-                {
-                    'term': {
-                        '_all': value.lower()
-                    }
-                },
-                {
-                    'prefix': {
-                        '_all': value.lower()
+            'query': {
+                'match': {
+                    self.mapping_type.autocomplete_field: {
+                        'query': value,
+                        'operator': 'and',
                     }
                 }
-            ]
+            }
         }
 
-    def build_complete_filter_raw(self, search, filter_raw):
-        filters = {}
-        if 'filter' in search:
-            current = search['filter']
-            if 'and' in current:
-                filters = current
+    def get_filter_query_string(self, query, query_str):
+        """Returns the filter of a query string, see
+        `django_esutils.query_string` for its syntax.
+
+        Compiled filters are cached by query string, filter set class and
+        settings:
+        repeated searches are neither parsed nor compiled again. They are
+        shared, do not mutate them.
+
+        Raises `QueryStringError` if the query string is invalid.
+        """
+        key = (type(self), type(query), self.mapping_type, query_str.strip(),
+               tuple(sorted(self.search_fields)),
+               tuple(sorted(self.search_actions.items())),
+               self.default_action, tuple(sorted(self.prefix_fields)),
+               self.all_filter, self.autocomplete)
+        compiled = query_string_cache.get(key)
+        if compiled is None:
+            compiled = self.compile_query_string(query, query_str)
+            query_string_cache.set(key, compiled)
+        return compiled
+
+    def compile_query_string(self, query, query_str):
+        """Returns the filter of a query string, terms of fields which are
+        not searchable being ignored."""
+        clauses = []
+        for term in parse_query_string(query_str):
+            clause = self.get_filter_term(query, term)
+            if clause is None:
+                continue
+            if term.negate:
+                clause = _bool('must_not', clause)
+            clauses.append(clause)
+
+        if not clauses:
+            return {'match_all': {}}
+        return self.combine_filters(clauses)
+
+    def get_filter_term(self, query, term):
+        """Returns the filter of a query string `Term`, None if its field is
+        not searchable."""
+        f = term.field
+        if f is None:
+            return self.get_filter_all(term.value)
+
+        if term.action == 'range':
+            if f not in self.search_fields:
+                return None
+            return {'range': {f: term.value}}
+
+        if f in self.nested_fields:
+            return self.get_filter_nested(f, [term.value])[0]
+        if f == 'ids':
+            return self.get_filter_ids(term.value)
+        if f in self.search_fields:
+            return query._process_filters([self.get_filter(f, term.value)])[0]
+        return None
+
+    def get_clauses(self, query):
+        """Returns the filter clauses of all the search terms, compiled in a
+        single pass: field filters first, then raw filters (nested, ids and
+        full text).
+
+        :params query: the `S` whose filter action handlers compile the
+            field filters.
+        """
+        search_fields = set(self.search_fields)
+        fields = []
+        clauses = []
+        # sorted, so that identical searches compile to identical bodies
+        for f in sorted(self.search_terms):
+            term = self.search_terms[f]
+            if f in self.nested_fields:
+                clauses.extend(self.cache_filters(
+                    f, self.get_filter_nested(f, term)))
+            elif f == 'ids':
+                clauses.extend(self.cache_filters(
+                    f, [self.get_filter_ids(term)]))
+            elif f == 'selection' and self.selection:
+                clauses.extend(self.cache_filters(
+                    f, [self.get_filter_selection(term)]))
+            elif f == self.all_filter:
+                clauses.extend(self.cache_filters(
+                    f, [self.get_filter_all(term)]))
+            elif f == self.query_filter:
+                clauses.extend(self.cache_filters(
+                    f, [self.get_filter_query_string(query, term)]))
+            elif f in search_fields:
+                fields.extend(self.cache_filters(
+                    f, query._process_filters([self.get_filter(f, term)])))
+        return fields + clauses
+
+    def cache_filters(self, f, clauses):
+        """Returns clauses with the ``_cache`` hint of the search key f, see
+        `filter_cache`. Clauses which are not bool filters are wrapped by one,
+        the filters supporting ``_cache`` varying."""
+        cache = self.filter_cache.get(f)
+        if cache is None:
+            return clauses
+
+        cached = []
+        for clause in clauses:
+            if list(clause) == ['bool']:
+                clause = {'bool': dict(clause['bool'], _cache=cache)}
             else:
-                filters['and'] = [current, ]
-            filters['and'].append(filter_raw)
-        else:
-            filters = filter_raw
-        return filters
-
-    def update_query(self, query, f, term=None, raw=False):
-        if not raw and f not in self.raw_fields:
-            return query.filter(self.get_filter(f, term))
-
-        elif raw and f in self.nested_fields:
-            for f_raw in self.get_filter_nested(f, term):
-                filters = self.build_complete_filter_raw(
-                    query.build_search(),
-                    f_raw)
-                query = query.filter_raw(filters)
-
-        elif raw and f == 'ids':
-            filters = self.build_complete_filter_raw(
-                query.build_search(),
-                self.get_filter_ids(term))
-            query = query.filter_raw(filters)
-
-        elif raw and f == self.all_filter:
-            filters = self.build_complete_filter_raw(
-                query.build_search(),
-                self.get_filter_all(term))
-            query = query.filter_raw(filters)
-        return query
+                clause = _bool('must', [clause], cache)
+            cached.append(clause)
+        return cached
+
+    def combine_filters(self, clauses):
+        """Returns a filter matching all the clauses."""
+        if len(clauses) == 1:
+            return clauses[0]
+        return _bool('must', clauses)
 
     @property
     def qs(self):
+        """Returns the query of the search terms, compiled once."""
+        if self._qs is None:
+            self._qs = self.get_query()
+        return self._qs
+
+    def get_query(self):
+        """Returns the query filtered by a single filter combining the
+        filters of the queryset and the clauses of the search terms."""
         query = self.queryset
 
         if query is None:
             query = self.mapping_type.query()
 
-        for f in self.search_fields:
-            if f not in self.search_terms.keys():
-                continue
-
-            term = self.search_terms.get(f)
-            query = self.update_query(query, f, term)
-
-        for f in self.raw_fields:
-            if f not in self.search_terms.keys():
-                continue
+        clauses = self.get_clauses(query)
+        if not clauses:
+            return query
+
+        current = query.build_search().get('filter')
+        if current is not None:
+            if list(current) == ['and']:
+                clauses = current['and'] + clauses
+            elif list(current) == ['bool'] and \
+                    list(current['bool']) == ['must'] and \
+                    isinstance(current['bool']['must'], list):
+                clauses = current['bool']['must'] + clauses
+            else:
+                clauses.insert(0, current)
 
-            term = self.search_terms.get(f)
+        return query.filter_raw(self.combine_filters(clauses))
 
-            query = self.update_query(query, f, term, raw=True)
+    def execute(self, start=0, stop=None):
+        """Returns the search results of a page, from start to stop, with
+        the total number of hits as `count`, from a single request.
 
-        return query
+        The total is kept so that `count` needs no other request.
+        """
+        results = self.qs[start:stop].execute()
+        self._count = results.count
+        return results
 
     @property
     def count(self):
-        return self.qs.count()
+        if self._count is None:
+            self._count = self.qs.count()
+        return self._count
 
     @property
     def form(self):
@@ -221,85 +455,114 @@ class ElasticutilsFilterSet(object):
         raise NotImplemented('Form not yet implemented')
 
 
+def get_value(params, key):
+    return params.get(key)
+
+
+def get_list(params, key):
+    return params.getlist(key)
+
+
 class ElasticutilsFilterBackend(SearchFilter):
 
-    key_separator = ':'
-    query_splitter = ' '
+    # (backend class, search_fields, all_filter, query_filter, mapping_type,
+    # selection) -> search keys and their index, see `get_search_key_index`
+    _search_key_indexes = {}
 
     def get_filter_class(self, view, queryset=None):
         return getattr(view, 'filter_class', ElasticutilsFilterSet)
 
     def get_search_keys(self, view, queryset=None):
-        search_keys = getattr(view, 'search_fields', [])
+        """Returns the search keys of the view: its search_fields, the all
+        and ids filters, the selection filter if enabled by the view
+        selection attribute and the inner fields of objects, computed
+        once per view configuration, see `get_search_key_index`."""
+        return self.get_search_key_index(view)[0]
+
+    def get_search_key_index(self, view):
+        """Returns ``(search_keys, index)``, index mapping query params to
+        ``(search key, parser)``: ``key`` to `get_value` and ``key[]`` to
+        `get_list`, ex.: {'tags[]': ('tags', get_list)}.
+
+        Computed once per backend class and view configuration, it is
+        shared: do not mutate it.
+        """
+        search_fields = tuple(getattr(view, 'search_fields', []))
         all_filter = getattr(view, 'all_filter', 'q')
+        query_filter = getattr(view, 'query_filter', None)
         mapping_type = getattr(view, 'mapping_type', None)
-        object_fields = mapping_type.get_object_fields()
-
-        if all_filter not in search_keys:
-            search_keys.append(all_filter)
-
-        if 'ids' not in search_keys:
-            search_keys.append('ids')
-
-        # For object type, you can filter on anny inner relation
-        # this code appends the inner relations to your search keys
-        for key, fields in object_fields.items():
-            for f in fields:
-                s_key = '{0}.{1}'.format(key, f)
-                if s_key not in search_keys:
-                    search_keys.append(s_key)
+        selection = getattr(view, 'selection', False)
+        cache_key = (type(self), search_fields, all_filter, query_filter,
+                     mapping_type, selection)
+        if cache_key not in self._search_key_indexes:
+            search_keys = list(search_fields)
+            object_fields = mapping_type.get_object_fields()
+
+            search_keys.extend([all_filter, 'ids'])
+            if selection:
+                search_keys.append('selection')
+            if query_filter:
+                search_keys.append(query_filter)
+
+            # For object type, you can filter on anny inner relation
+            # this code appends the inner relations to your search keys
+            for key, fields in object_fields.items():
+                for f in fields:
+                    search_keys.append('{0}.{1}'.format(key, f))
+
+            search_keys = tuple(OrderedDict.fromkeys(search_keys))
+
+            index = {}
+            for s_key in search_keys:
+                # ex.: {'tag': 'yo'}
+                index[s_key] = (s_key, get_value)
+                # ex.: {'tags[]': [1, 2]}
+                index['{0}[]'.format(s_key)] = (s_key, get_list)
 
-        return search_keys
+            self._search_key_indexes[cache_key] = (search_keys, index)
+        return self._search_key_indexes[cache_key]
 
     def split_query_str(self, query_str):
-        """
+        """Returns the values of the terms of a query string, see
+        `django_esutils.query_string`.
+
         >>> self.split_query_str('helo')
         {'_all': 'helo'}
 
-        >>> self.split_query_str('firstname:bob lastname:dylan')
-        {'firstname': 'bob', 'lastname': 'dylan'}
-        """
-        # little cleaning
-        query_str = query_str.strip()
-
-        if self.key_separator not in query_str:
-            return {'_all': query_str}
+        >>> self.split_query_str('firstname:bob lastname:"bob dylan"')
+        {'firstname': 'bob', 'lastname': 'bob dylan'}
 
-        return dict([s.strip().split(self.key_separator)
-                     for s in query_str.split(self.query_splitter)])
+        Negations are lost and ranges are dicts of bounds, filter sets
+        compile query strings of their query_filter search key as a whole.
+        """
+        search_terms = {}
+        for term in parse_query_string(query_str):
+            if term.field is None:
+                search_terms['_all'] = ' '.join(
+                    [search_terms['_all'], term.value]) \
+                    if '_all' in search_terms else term.value
+            else:
+                search_terms[term.field] = term.value
+        return search_terms
 
     def get_search_terms(self, request, view, queryset=None):
         """Return Splitted query string automagically.
+
+        A value can be empty and found in the query params, which means we
+        search for the missing fields.
         """
-        params = request.QUERY_PARAMS.copy()
-        search_keys = self.get_search_keys(view)
+        params = request.QUERY_PARAMS
+        index = self.get_search_key_index(view)[1]
 
         search_terms = dict()
 
-        for s_key in search_keys:
-            # no value found at start
-            # A value can be None and found in the query params
-            # which means we search for the missing fields
-            value = None
-            found = False
-            # get value or valuelist
-            for key in params.keys():
-                # ex.: {'tag': 'yo'}
-                if key == s_key:
-                    found = True
-                    value = params.get(key)
-                    break
-                # ex.: {'tags[]': [1, 2]}
-                if key == '{0}[]'.format(s_key):
-                    found = True
-                    value = params.getlist(key)
-                    break
-            # nothing to search
-            if not value and not found:
+        for key in params:
+            if key not in index:
                 continue
-            # update search values
-
-            search_terms[s_key] = value
+            s_key, parser = index[key]
+            # first of key and key[] wins
+            if s_key not in search_terms:
+                search_terms[s_key] = parser(params, key)
 
         return search_terms
 
@@ -308,18 +571,30 @@ class ElasticutilsFilterBackend(SearchFilter):
         search_terms = self.get_search_terms(request, view, queryset)
         search_actions = getattr(view, 'search_actions', None)
 
-        search_fields = getattr(view, 'search_fields', search_terms.keys())
+        search_fields = self.get_search_keys(view, queryset)
         all_filter = getattr(view, 'all_filter', 'q')
         prefix_fields = getattr(view, 'prefix_fields', None)
+        filter_cache = getattr(view, 'filter_cache', None)
+        autocomplete = getattr(view, 'autocomplete', None)
+        query_filter = getattr(view, 'query_filter', None)
+        selection = getattr(view, 'selection', False)
 
         mapping_type = getattr(view, 'mapping_type', None)
 
         filter_class = self.get_filter_class(view, queryset)
 
-        return filter_class(search_fields=search_fields,
-                            search_actions=search_actions,
-                            search_terms=search_terms,
-                            mapping_type=mapping_type,
-                            queryset=queryset,
-                            all_filter=all_filter,
-                            prefix_fields=prefix_fields).qs
+        filter_set = filter_class(search_fields=search_fields,
+                                  search_actions=search_actions,
+                                  search_terms=search_terms,
+                                  mapping_type=mapping_type,
+                                  queryset=queryset,
+                                  all_filter=all_filter,
+                                  prefix_fields=prefix_fields,
+                                  filter_cache=filter_cache,
+                                  autocomplete=autocomplete,
+                                  query_filter=query_filter,
+                                  selection=selection)
+        try:
+            return filter_set.qs
+        except QueryStringError as e:
+            raise ParseError(six.text_type(e))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from django_esutils.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    args = "drain_index_outbox"
+    help = """Sends the index operations stored in the outbox."""
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    type='int',
+                    dest='batch_size',
+                    default=5000,
+                    help='Number of outbox rows claimed at once.'),
+        make_option('--database',
+                    dest='database',
+                    default='default',
+                    help='Database alias of the outbox.'),
+        make_option('--max-attempts',
+                    type='int',
+                    dest='max_attempts',
+                    default=10,
+                    help='Attempts of a failed row before it is dead.'),
+        make_option('--loop',
+                    action='store_true',
+                    dest='loop',
+                    default=False,
+                    help='Keep draining, waiting when no row is drained.'),
+        make_option('--interval',
+                    type='float',
+                    dest='interval',
+                    default=1,
+                    help='Seconds to wait when no row is drained, doubled '
+                         'while nothing is drained.'),
+        make_option('--max-interval',
+                    type='float',
+                    dest='max_interval',
+                    default=60,
+                    help='Max seconds to wait when no row is drained.'),
+    )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            count, result = drain_outbox(
+                batch_size=options['batch_size'],
+                database=options['database'],
+                max_attempts=options['max_attempts'])
+            if count:
+                self.stdout.write('{0} rows drained: {1}'.format(count,
+                                                                 result))
+            # some rows are drained, claim the next ones right away
+            if count and (result.success or not result.errors):
+                interval = options['interval']
+                continue
+            if not options['loop']:
+                return
+            time.sleep(interval)
+            interval = min(interval * 2, options['max_interval'])
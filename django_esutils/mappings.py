@@ -1,13 +1,188 @@
 """Base mapping module for easier specific usage."""
+import copy
+import hashlib
+import logging
+import math
+import time
+from datetime import datetime
+from datetime import timedelta
+from multiprocessing import Pool
+from operator import itemgetter
+
+from celery import group
+
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.db.transaction import TransactionManagementError
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.utils import six
+from django.utils.timezone import now
 
 from elasticsearch.exceptions import NotFoundError
+from elasticsearch.exceptions import TransportError
+from elasticsearch.helpers import BulkIndexError
 
 from elasticutils.contrib.django import S as _S
 from elasticutils.contrib.django import MappingType
 from elasticutils.contrib.django import Indexable
+from elasticutils.utils import chunked
+
+from django_esutils import bulk
+from django_esutils import outbox
+from django_esutils.cache import LRUCache
+from django_esutils.cache import bump_generations
+from django_esutils.cache import get_cached_search
+from django_esutils.cache import get_search_key
+from django_esutils.cache import is_process_local
+from django_esutils.cache import resolve_cache
+from django_esutils.models import IndexCheckpoint
+from django_esutils.models import IndexTombstone
+from django_esutils.models import in_bulk_delete
+from django_esutils.tasks import bulk_index_objects
+from django_esutils.tasks import bulk_unindex_objects
+from django_esutils.tasks import bulk_update_objects
+from django_esutils.tasks import index_partition
+from django_esutils.transaction import buffer_ids
+from django_esutils.transaction import get_index_buffer
+
+
+log = logging.getLogger('django_esutils')
+
+# mapping types of the integer nested fields, see `get_nested_field_types`
+INTEGER_TYPES = ('integer', 'long', 'short', 'byte')
+
+# selection documents stored by this process, see `store_selection`
+_stored_selections = LRUCache(max_size=1000)
+
+
+def _getter(k_1, k_2=None):
+    """Returns a function reading ``obj.k_1`` or ``obj.k_1.k_2``, None if any
+    of them is missing."""
+    def getter(obj):
+        field = getattr(obj, k_1, None)
+        if field and k_2:
+            field = getattr(field, k_2, None)
+        return field
+    return getter
+
+
+def _stringify(getter):
+    """Wraps getter to serialize its result as a string, ex.: pks."""
+    def stringify(obj):
+        value = getter(obj)
+        return str(value) if value else value
+    return stringify
+
+
+def _row_sub_document(fk_column, columns):
+    """Returns a function building a foreign object sub document from a
+    `values_list` row, None if the foreign key is."""
+    def sub_document(row):
+        if row[fk_column] is None:
+            return None
+        return dict((k_field, row[i]) for k_field, i in columns)
+    return sub_document
+
 
-from django_esutils import tasks
+def _flattener(mapping_type, k):
+    """Returns a function flattening the ``k`` related manager of obj."""
+    def flattener(obj):
+        return mapping_type.flat(k, getattr(obj, k))
+    return flattener
+
+
+def _sub_document(k, getters):
+    """Returns a function building the ``k`` foreign object sub document."""
+    def sub_document(obj):
+        foreign_obj = getattr(obj, k, None)
+        if not foreign_obj:
+            return foreign_obj
+        return dict((k_field, getter(foreign_obj))
+                    for k_field, getter in getters)
+    return sub_document
+
+
+def _index_partition(args):
+    """Process pool entry point of `SearchMappingType.run_index_partitioned`.
+    """
+    mapping_type, min_pk, max_pk, number, database = args
+    return mapping_type.index_partition(min_pk, max_pk, number=number,
+                                        database=database)
+
+
+class SourceObject(object):
+    """Model instance lookalike of a search result.
+
+    Attributes are read from the result source, converted by the model
+    fields, ex.: ``'2014-10-17T16:26:00'`` to a datetime, and from the
+    database object for names the source does not store. 2 level keys are
+    read as related objects, ex.: ``obj.author.username`` for
+    ``'author.username'``.
+
+    :params values: source values.
+    :params get_object: callable returning the database object.
+    :params model: model of the database object, converts values.
+    """
+
+    def __init__(self, values, get_object, model=None):
+        self._values = values
+        self._get_object = get_object
+        self._model = model
+        self._object = None
+
+    def get_object(self):
+        if self._object is None:
+            self._object = self._get_object()
+        return self._object
+
+    def get_field(self, name):
+        if self._model is None:
+            return None
+        try:
+            return self._model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name == 'pk' and self._model is not None:
+            name = self._model._meta.pk.name
+
+        field = self.get_field(name)
+        if name in self._values:
+            value = self._values[name]
+            if field is None or field.rel or value is None:
+                return value
+            return field.to_python(value)
+
+        prefix = name + '.'
+        values = dict((k[len(prefix):], v) for k, v in self._values.items()
+                      if k.startswith(prefix))
+        if values:
+            return SourceObject(values,
+                                lambda: getattr(self.get_object(), name),
+                                field.rel.to if field and field.rel else None)
+
+        # not in the source
+        return getattr(self.get_object(), name)
+
+    def serializable_value(self, name):
+        """Same as `Model.serializable_value`, foreign keys are read from
+        the key of their related field, ex.: 'category.id'."""
+        field = self.get_field(name)
+        if field is None or not field.rel:
+            return getattr(self, name)
+        related_field = field.rel.get_related_field()
+        key = '{0}.{1}'.format(name, related_field.name)
+        if key in self._values:
+            value = self._values[key]
+            return value if value is None else related_field.to_python(value)
+        return getattr(self.get_object(), field.attname)
 
 
 class S(_S):
@@ -30,9 +205,45 @@ class S(_S):
                 }
             }
 
+    def get_cache_key(self):
+        """Returns a stable key of the search, see `get_search_key`."""
+        return get_search_key([self.build_search(), self.get_indexes(),
+                               self.get_doctypes(), self.search_type])
+
+    def raw(self):
+        """Returns the raw search response, from the search cache of the
+        mapping type if enabled, see `SearchMappingType.search_cache`.
+
+        Responses are cached with the write generations of the searched
+        indexes, see `search_generation_cache`, and not cached if an index
+        was written less than search_cache_refresh_delay seconds ago, the
+        write may not be searchable yet.
+        """
+        cache = self.type.get_search_cache() if self.type is not None \
+            else None
+        if cache is None:
+            return super(S, self).raw()
+
+        key = self.get_cache_key()
+        response, generations = get_cached_search(
+            cache, key, self.get_indexes(),
+            self.type.get_search_generation_cache())
+        if response is not None:
+            return response
+
+        response = super(S, self).raw()
+        if time.time() - max(generations) >= \
+                self.type.search_cache_refresh_delay:
+            cache.set(key, (generations, response),
+                      self.type.search_cache_timeout)
+        return response
+
     def all(self):
-        for r in self.execute():
-            yield r.get_object()
+        """Yields model instances of the results in results order, loaded
+        at once by `SearchMappingType.hydrate`. Results missing from the
+        database are skipped."""
+        for obj in self.type.hydrate_results(self.execute()):
+            yield obj
 
 
 class SearchMappingType(MappingType, Indexable):
@@ -46,8 +257,69 @@ class SearchMappingType(MappingType, Indexable):
 
     id_field = 'id'
     _nested_fields = None
+    _nested_field_types = None
     _object_fields = None
+    _extraction_plan = None
     rel_sep = '.'
+    extract_chunk_size = 500
+    # 'model' extracts documents from model instances, 'values' from
+    # `values_list` rows without instantiating models
+    extraction_mode = 'model'
+    _values_plan = None
+    # limits of a single bulk request
+    bulk_max_docs = 500
+    bulk_max_bytes = 5 * 1024 * 1024
+    # index settings while loading a new index, see `rebuild_index`
+    bulk_load_index_settings = {
+        'refresh_interval': '-1',
+        'number_of_replicas': 0,
+    }
+    # model field holding the modification date, enables `run_index_delta`
+    updated_field = None
+    # rows committed late with an older date are still caught by the delta
+    delta_overlap = timedelta(minutes=1)
+    # keep a tombstone of deleted objects, unindexed by `run_index_delta`
+    use_tombstones = False
+    # store index operations in the outbox instead of sending tasks
+    use_outbox = False
+    # relations loaded with model instances of search results, see `hydrate`
+    hydrate_select_related = ()
+    hydrate_prefetch_related = ()
+    # cache of hydrated instances, disabled if None, a Django cache alias or
+    # instance shared by processes, see `get_hydration_cache`
+    hydration_cache = None
+    hydration_cache_timeout = 300
+    # cache of search responses, disabled if None, a Django cache alias or a
+    # cache instance like `LRUCache`, see `S.raw`
+    search_cache = None
+    search_cache_timeout = 60
+    # cache of the write generations invalidating search responses, shared
+    # by the web and worker processes: a Django cache alias or instance,
+    # not an in process cache, see `get_search_generation_cache`
+    search_generation_cache = 'default'
+    # seconds for a write to be searchable, index refresh_interval
+    search_cache_refresh_delay = 1
+    # partially update documents on queryset updates of fields mapped as is,
+    # only if extract_document does not compute values from other fields
+    partial_update = False
+    # id filters of more ids are terms lookups of a selection document, see
+    # `get_ids_filter`, disabled if None
+    selection_threshold = 1000
+    # index of selection documents, `get_index()` + '_selections' if None
+    selection_index = None
+    selection_doc_type = 'selection'
+    # seconds a selection stored by this process is not stored again, in case
+    # its document or index was deleted meanwhile
+    selection_cache_timeout = 300
+    # expiration of selection documents not stored again meanwhile
+    selection_ttl = '1d'
+    # fields copied to autocomplete_field, analyzed by edge ngrams, searched
+    # by the all filter of filter sets, ex.: ('subject', 'category.name'),
+    # or inner fields of objects, ex.: 'library.name'
+    autocomplete_fields = ()
+    autocomplete_field = 'autocomplete'
+    autocomplete_min_gram = 1
+    autocomplete_max_gram = 20
 
     @classmethod
     def get_index(cls):
@@ -59,6 +331,12 @@ class SearchMappingType(MappingType, Indexable):
         """Returns model name by default for mapping type name."""
         return cls.get_model()._meta.model_name
 
+    @classmethod
+    def get_mapping_type_path(cls):
+        """Returns the dotted path of the mapping type class, ex.:
+        'demo_esutils.mappings.ArticleMappingType'."""
+        return '{0}.{1}'.format(cls.__module__, cls.__name__)
+
     @classmethod
     def doc_type(cls):
         """Shortcuts for easy es base use."""
@@ -99,6 +377,38 @@ class SearchMappingType(MappingType, Indexable):
         return cls._nested_fields[field] if field in cls._nested_fields \
             else cls._nested_fields
 
+    @classmethod
+    def get_nested_field_types(cls, field=None):
+        """Returns fields of nested fields by type: integer (any integer
+        type), date and string, computed once.
+
+        ..code-block: python
+
+            >>> ArticleMappingType.get_nested_field_types()
+            {
+                'category': {'integer': ['pk'], 'date': [], 'string': ['name']}
+            }
+
+        :param field: request only fields of this nested field (optional)
+        """
+        # not set already
+        if cls._nested_field_types is None:
+            cls._nested_field_types = {}
+            for k, v in cls.get_field_mapping().items():
+                if not v.get('type') == 'nested':
+                    continue
+                types = {'integer': [], 'date': [], 'string': []}
+                for _k, _v in v.get('properties', {}).items():
+                    _type = _v.get('type')
+                    if _type in INTEGER_TYPES:
+                        types['integer'].append(_k)
+                    elif _type in types:
+                        types[_type].append(_k)
+                cls._nested_field_types[k] = types
+
+        return cls._nested_field_types[field] \
+            if field in cls._nested_field_types else cls._nested_field_types
+
     @classmethod
     def get_object_fields(cls, field=None):
         # not set already
@@ -116,7 +426,8 @@ class SearchMappingType(MappingType, Indexable):
 
     @classmethod
     def get_mapping(cls):
-        """Returns ES mapping spec including get_field_mapping result."""
+        """Returns ES mapping spec including get_field_mapping result and the
+        autocomplete field, see `get_autocomplete_mapping`."""
         return {
             '_all': {
                 'enabled': settings.ES_SOURCE_ENABLED,
@@ -124,9 +435,86 @@ class SearchMappingType(MappingType, Indexable):
             '_source': {
                 'enabled': settings.ES_SOURCE_ENABLED,
             },
-            'properties': cls.get_field_mapping(),
+            'properties': cls.get_autocomplete_mapping(
+                cls.get_field_mapping()),
         }
 
+    @classmethod
+    def get_autocomplete_analysis(cls):
+        """Returns the analysis settings of the autocomplete field: edge
+        ngrams of lowercased words, searched by lowercased words truncated to
+        the longest ngram."""
+        return {
+            'filter': {
+                'esutils_autocomplete': {
+                    'type': 'edgeNGram',
+                    'min_gram': cls.autocomplete_min_gram,
+                    'max_gram': cls.autocomplete_max_gram,
+                },
+                'esutils_autocomplete_truncate': {
+                    'type': 'truncate',
+                    'length': cls.autocomplete_max_gram,
+                },
+            },
+            'analyzer': {
+                'esutils_autocomplete': {
+                    'type': 'custom',
+                    'tokenizer': 'standard',
+                    'filter': ['lowercase', 'esutils_autocomplete'],
+                },
+                'esutils_autocomplete_search': {
+                    'type': 'custom',
+                    'tokenizer': 'standard',
+                    'filter': ['lowercase', 'esutils_autocomplete_truncate'],
+                },
+            },
+        }
+
+    @classmethod
+    def get_autocomplete_mapping(cls, properties):
+        """Returns a copy of mapping properties whose autocomplete_fields are
+        copied to the autocomplete field, added with its analyzers.
+
+        .. Note::
+
+            The index must be created with `get_index_settings`, ex.: by
+            `rebuild_index`, for the analyzers to exist.
+        """
+        if not cls.autocomplete_fields:
+            return properties
+
+        properties = copy.deepcopy(properties)
+        for f in cls.autocomplete_fields:
+            if f in properties:
+                # fields and dotted fields, ex.: 'category.name'
+                field = properties[f]
+            else:
+                # inner fields of objects, ex.: 'library.name'
+                field = {'properties': properties}
+                for name in f.split(cls.rel_sep):
+                    field = field['properties'][name]
+            field['copy_to'] = cls.autocomplete_field
+
+        properties[cls.autocomplete_field] = {
+            'type': 'string',
+            'index_analyzer': 'esutils_autocomplete',
+            'search_analyzer': 'esutils_autocomplete_search',
+        }
+        return properties
+
+    @classmethod
+    def get_index_settings(cls, index_settings=None):
+        """Returns a copy of index settings, default=ES_INDEX_SETTINGS, with
+        the autocomplete analysis if there are autocomplete_fields."""
+        index_settings = copy.deepcopy(index_settings or
+                                       settings.ES_INDEX_SETTINGS)
+        if cls.autocomplete_fields:
+            analysis = index_settings.setdefault('index', {}) \
+                .setdefault('analysis', {})
+            for k, v in cls.get_autocomplete_analysis().items():
+                analysis.setdefault(k, {}).update(v)
+        return index_settings
+
     @classmethod
     def flat(cls, field, queryset, column='pk', order_by=None):
         """Flats queryset values accoding passed column.
@@ -137,15 +525,352 @@ class SearchMappingType(MappingType, Indexable):
         :params order_by: default=column.
         """
 
+        # related objects already loaded by prefetch_related, avoid the query
+        prefetched = getattr(queryset, 'get_queryset', lambda: None)()
+        if getattr(prefetched, '_prefetch_done', False):
+            return cls.flat_objects(field, prefetched, column=column,
+                                    order_by=order_by)
+
         qs = queryset.values(*cls.get_nested_fields(field=field))
         qs = qs.order_by(order_by or column)
         return list(qs)
 
     @classmethod
-    def get_object_by_id(cls, obj_id):
+    def flat_objects(cls, field, objects, column='pk', order_by=None):
+        """Same as `flat` but for already loaded related objects.
+
+        :params field: name of the field related.
+        :params objects: iterable of related model instances.
+        :params column: default=pk.
+        :params order_by: default=column.
+        """
+        objects = sorted(objects,
+                         key=lambda o: getattr(o, order_by or column))
+        if not objects:
+            return []
+
+        # mimic `values()` which returns raw foreign key values
+        opts = objects[0]._meta
+        columns = []
+        for f in cls.get_nested_fields(field=field):
+            try:
+                columns.append((f, opts.get_field(f).attname))
+            except FieldDoesNotExist:
+                columns.append((f, f))
+
+        return [dict((f, getattr(o, attname)) for f, attname in columns)
+                for o in objects]
+
+    @classmethod
+    def get_related_lookups(cls):
+        """Returns ``(select_related, prefetch_related)`` lookups required to
+        extract documents without extra queries, according mapping keys.
+
+        ..code-block: python
+
+            >>> ArticleMappingType.get_related_lookups()
+            (['author', 'category', 'library'], ['contributors'])
+        """
+        opts = cls.get_model()._meta
+        select_related, prefetch_related = set(), set()
+        for k in cls.get_field_mapping().keys():
+            name = k.split(cls.rel_sep)[0]
+            try:
+                field, model, direct, m2m = opts.get_field_by_name(name)
+            except FieldDoesNotExist:
+                continue
+            # many to many and reverse relations are managers
+            if m2m or not direct:
+                prefetch_related.add(name)
+            elif field.rel:
+                select_related.add(name)
+        return sorted(select_related), sorted(prefetch_related)
+
+    @classmethod
+    def get_extraction_queryset(cls, database=None):
+        """Returns model queryset joining and prefetching every relation
+        required by `extract_document`."""
+        select_related, prefetch_related = cls.get_related_lookups()
+        qs = cls.get_model().objects.using(database)
+        if select_related:
+            qs = qs.select_related(*select_related)
+        if prefetch_related:
+            qs = qs.prefetch_related(*prefetch_related)
+        return qs
+
+    @classmethod
+    def id_field_is_pk(cls):
+        """Returns True if documents are identified by the model pk."""
+        return cls.id_field in ('pk', cls.get_model()._meta.pk.name)
+
+    @classmethod
+    def get_object_by_id(cls, obj_id, version=None):
+        """Returns the model instance of an id, from the hydration cache if
+        enabled, a version given and the cached instance has this version.
+        """
+        if version is not None and cls.get_hydration_cache() is not None:
+            objects, missing = cls.hydrate([obj_id], versions=[version])
+            if missing:
+                raise cls.get_model().DoesNotExist(
+                    '{0} {1} does not exist.'.format(
+                        cls.get_model()._meta.object_name, obj_id))
+            return objects[0]
         kwargs = {cls.id_field: obj_id}
         return cls.get_model().objects.get(**kwargs)
 
+    def get_object(self):
+        """Returns the model instance of this search result, from the
+        hydration cache if its version is cached, see `get_object_by_id`."""
+        return self.get_object_by_id(self._id, self.get_version())
+
+    def get_source_object(self):
+        """Returns a `SourceObject` of this search result, reading the
+        database object only for values missing from the source."""
+        return SourceObject(self._results_dict, self.get_object,
+                            self.get_model())
+
+    @classmethod
+    def get_hydration_queryset(cls, database=None):
+        """Returns model queryset used by `hydrate`, joining
+        hydrate_select_related and prefetching hydrate_prefetch_related."""
+        qs = cls.get_model().objects.using(database)
+        if cls.hydrate_select_related:
+            qs = qs.select_related(*cls.hydrate_select_related)
+        if cls.hydrate_prefetch_related:
+            qs = qs.prefetch_related(*cls.hydrate_prefetch_related)
+        return qs
+
+    @classmethod
+    def hydrate(cls, ids, database=None, versions=None):
+        """Returns ``(objects, missing ids)``: model instances of ids, in ids
+        order, loaded by a single query like `in_bulk`, and the ids missing
+        from the database.
+
+        With a hydration_cache, cached instances of the same version are not
+        loaded again, loaded instances are cached with their version.
+        Instances without version are neither read from nor written to the
+        cache: they could not be checked against the search results.
+
+        ..code-block: python
+
+            >>> ArticleMappingType.hydrate(['3', '1', '42'])
+            ([<Article: 3>, <Article: 1>], ['42'])
+
+        :params ids: ids of search results, ex.: `_id` of hits.
+        :params versions: versions of the search results, in ids order, see
+            `get_version`.
+        """
+        if not ids:
+            return [], []
+        versions = dict((str(obj_id), version) for obj_id, version
+                        in zip(ids, versions or [None] * len(ids))
+                        if version is not None)
+
+        cache = cls.get_hydration_cache()
+        objects = {}
+        if cache is not None and versions:
+            objects = cls.get_cached_objects(cache, versions)
+
+        missing = [obj_id for obj_id in ids if str(obj_id) not in objects]
+        if missing:
+            lookup = '{0}__in'.format(cls.id_field)
+            loaded = dict(
+                (str(getattr(obj, cls.id_field)), obj)
+                for obj in cls.get_hydration_queryset(database).filter(
+                    **{lookup: missing}))
+            if cache is not None and versions:
+                cache.set_many(
+                    dict((cls.get_hydration_cache_key(obj_id),
+                          (versions[obj_id], obj))
+                         for obj_id, obj in loaded.items()
+                         if obj_id in versions),
+                    cls.hydration_cache_timeout)
+            objects.update(loaded)
+
+        return ([objects[str(obj_id)] for obj_id in ids
+                 if str(obj_id) in objects],
+                [obj_id for obj_id in ids if str(obj_id) not in objects])
+
+    @classmethod
+    def hydrate_results(cls, results):
+        """Returns model instances of search results in results order, see
+        `hydrate`. Results missing from the database are skipped."""
+        results = list(results)
+        objects, missing = cls.hydrate(
+            [r._id for r in results],
+            versions=[r.get_version() for r in results])
+        if missing:
+            log.warning('{0} {1} result(s) missing from the database: '
+                        '{2}'.format(len(missing),
+                                     cls.get_mapping_type_name(),
+                                     missing[:10]))
+        return objects
+
+    @classmethod
+    def get_hydration_cache(cls):
+        """Returns the hydration cache or None if disabled.
+
+        Writes invalidate cached instances in their process only: an in
+        process cache would keep serving stale instances to other processes,
+        it raises ImproperlyConfigured.
+        """
+        cache = resolve_cache(cls.hydration_cache)
+        if is_process_local(cache):
+            raise ImproperlyConfigured(
+                '{0}.hydration_cache must be shared by processes, ex.: a '
+                'memcached cache alias.'.format(cls.__name__))
+        return cache
+
+    @classmethod
+    def get_search_cache(cls):
+        """Returns the search cache or None if disabled."""
+        return resolve_cache(cls.search_cache)
+
+    @classmethod
+    def get_search_generation_cache(cls):
+        """Returns the cache of write generations.
+
+        Index writes run in worker processes: an in process cache would not
+        invalidate the searches cached by web processes, it raises
+        ImproperlyConfigured.
+        """
+        cache = resolve_cache(cls.search_generation_cache)
+        if is_process_local(cache):
+            raise ImproperlyConfigured(
+                '{0}.search_generation_cache must be shared by processes, '
+                'ex.: a memcached cache alias.'.format(cls.__name__))
+        return cache
+
+    @classmethod
+    def bump_write_generation(cls, index=None):
+        """Invalidates cached searches of the index, default=get_index(),
+        see `S.raw`."""
+        if cls.search_cache is not None:
+            bump_generations(cls.get_search_generation_cache(),
+                             set([cls.get_index(), index or cls.get_index()]))
+
+    @classmethod
+    def get_selection_index(cls):
+        return cls.selection_index or '{0}_selections'.format(cls.get_index())
+
+    @classmethod
+    def get_selection_mapping(cls):
+        """Returns the mapping of selection documents, expiring after
+        selection_ttl."""
+        return {
+            cls.selection_doc_type: {
+                '_ttl': {'enabled': True, 'default': cls.selection_ttl},
+                'properties': {
+                    'ids': {'type': 'string', 'index': 'no'},
+                },
+            },
+        }
+
+    @classmethod
+    def store_selection(cls, ids, es=None):
+        """Stores a selection document of ids and returns its id, to filter
+        searches by a terms lookup, see `get_selection_filter`.
+
+        The document id is a hash of the ids: a selection is stored once per
+        process every `selection_cache_timeout` seconds and Elasticsearch
+        caches its lookup. Selections expire after `selection_ttl` unless
+        stored again.
+
+        .. Note::
+
+            The selection index is created with `get_selection_mapping`, a
+            selection index created before has to be deleted for documents
+            to expire.
+        """
+        ids = sorted(set(str(obj_id) for obj_id in ids))
+        selection_id = hashlib.sha1(','.join(ids).encode('utf-8')).hexdigest()
+
+        index = cls.get_selection_index()
+        key = '{0}:{1}'.format(index, selection_id)
+        if _stored_selections.get(key) is None:
+            es = es or cls.get_es()
+            if _stored_selections.get(index) is None:
+                # already exists
+                es.indices.create(index, body={
+                    'mappings': cls.get_selection_mapping()}, ignore=400)
+                _stored_selections.set(index, True,
+                                       timeout=cls.selection_cache_timeout)
+            es.index(index, cls.selection_doc_type, {'ids': ids},
+                     id=selection_id, ttl=cls.selection_ttl)
+            _stored_selections.set(key, True,
+                                   timeout=cls.selection_cache_timeout)
+        return selection_id
+
+    @classmethod
+    def get_selection_filter(cls, selection_id):
+        """Returns a filter of the documents whose id is in a selection
+        document, see `store_selection`."""
+        return {
+            'terms': {
+                '_id': {
+                    'index': cls.get_selection_index(),
+                    'type': cls.selection_doc_type,
+                    'id': selection_id,
+                    'path': 'ids',
+                }
+            }
+        }
+
+    @classmethod
+    def get_ids_filter(cls, ids, es=None):
+        """Returns a filter of the documents of ids: an ids filter, or a
+        terms lookup of a stored selection document above
+        `selection_threshold` ids, which keeps search bodies small."""
+        if cls.selection_threshold is not None and \
+                len(ids) > cls.selection_threshold:
+            return cls.get_selection_filter(cls.store_selection(ids, es=es))
+        return {
+            'ids': {
+                'values': ids
+            }
+        }
+
+    @classmethod
+    def get_hydration_cache_key(cls, obj_id):
+        return 'django_esutils:hydrate:{0}:{1}'.format(
+            cls.get_mapping_type_path(), obj_id)
+
+    @classmethod
+    def get_cached_objects(cls, cache, versions):
+        """Returns ``{id: instance}`` of the cached instances whose version
+        is the requested one.
+
+        :params versions: ``{id: version}`` dict.
+        """
+        keys = dict((cls.get_hydration_cache_key(obj_id), obj_id)
+                    for obj_id in versions)
+        objects = {}
+        for key, (version, obj) in cache.get_many(list(keys)).items():
+            obj_id = keys[key]
+            if version == versions[obj_id]:
+                objects[obj_id] = obj
+        return objects
+
+    @classmethod
+    def invalidate_hydration_cache(cls, ids):
+        """Removes instances of ids from the hydration cache."""
+        cache = cls.get_hydration_cache()
+        if cache is not None and ids:
+            cache.delete_many([cls.get_hydration_cache_key(obj_id)
+                               for obj_id in ids])
+
+    def get_version(self):
+        """Returns the version of this search result, its updated_field
+        value, or None."""
+        if not self.updated_field:
+            return None
+        return self._results_dict.get(self.updated_field)
+
+    @classmethod
+    def split_key(cls, k):
+        """Returns ``(k_1, k_2)`` for a 2 level key or ``(k, None)``."""
+        return (k, None) if cls.rel_sep not in k else k.split(cls.rel_sep)
+
     @classmethod
     def serialize_field(cls, obj, k):
         # split key if is a 2 level key or one level key, ex.:
@@ -166,6 +891,50 @@ class SearchMappingType(MappingType, Indexable):
 
         return k_1, field
 
+    @classmethod
+    def compile_extraction_plan(cls):
+        """Returns a list of ``(key, accessor)`` computing each document value
+        from an object, according mapping keys and model fields.
+
+        Keys are split, model fields are looked up and mapping properties are
+        read once here so that `extract_document` only runs accessors.
+        """
+        mapping = cls.get_field_mapping()
+        opts = cls.get_model()._meta
+
+        plan = []
+        for k in [cls.id_field] + [k for k in mapping.keys()
+                                   if k != cls.id_field]:
+            k_1, k_2 = cls.split_key(k)
+            try:
+                field, model, direct, m2m = opts.get_field_by_name(k_1)
+            except FieldDoesNotExist:
+                field, direct, m2m = None, True, False
+
+            if k == cls.id_field:
+                accessor = _stringify(_getter(k_1, k_2))
+            elif field is not None and k_2 is None and (m2m or not direct):
+                # many to many or reverse relation manager
+                accessor = _flattener(cls, k)
+            elif k_2 is None and direct and field is not None and \
+                    field.get_internal_type() == 'ForeignKey' and \
+                    'properties' in mapping[k]:
+                accessor = _sub_document(
+                    k_1, [(p, _getter(*cls.split_key(p)))
+                          for p in mapping[k]['properties']])
+            else:
+                accessor = _getter(k_1, k_2)
+            plan.append((k, accessor))
+        return plan
+
+    @classmethod
+    def get_extraction_plan(cls):
+        """Returns the extraction plan compiled once per mapping type."""
+        # own attribute only, subclasses compile their own plan
+        if cls.__dict__.get('_extraction_plan') is None:
+            cls._extraction_plan = cls.compile_extraction_plan()
+        return cls._extraction_plan
+
     @classmethod
     def extract_document(cls, obj_id, obj=None):
         """Returns json doc to index for a given pkand the current mapping."""
@@ -174,35 +943,186 @@ class SearchMappingType(MappingType, Indexable):
         if obj is None:
             obj = cls.get_object_by_id(obj_id)
 
-        # shortcut
-        mapping_keys = [cls.id_field] + cls.get_field_mapping().keys()
+        # build doc according compiled mapping keys and obj values
+        return dict((k, accessor(obj))
+                    for k, accessor in cls.get_extraction_plan())
 
-        # build doc according mapping keys and obj values
-        doc = {}
-        for k in mapping_keys:
-            model_k, doc[k] = cls.serialize_field(obj, k)
+    @classmethod
+    def extract_documents(cls, ids, chunk_size=None, database=None):
+        """Yields json docs to index for the given pks.
 
-            # ensure pk serialization
-            if doc[k] and k == cls.id_field:
-                doc[k] = str(doc[k])
+        Objects are loaded by chunks, each one with a single query plus one
+        query per prefetched relation, instead of the several queries per
+        object `extract_document` costs when called alone.
 
-            if doc[k].__class__.__name__ in ['ManyRelatedManager',
-                                             'RelatedManager']:
-                doc[k] = cls.flat(k, doc[k])
-                continue
+        :params ids: pks of the objects to extract.
+        :params chunk_size: default=extract_chunk_size.
+        :params database: database alias to read from.
+        """
+        if cls.extraction_mode == 'values':
+            for doc in cls.extract_documents_from_values(ids, chunk_size,
+                                                         database):
+                yield doc
+            return
 
-            if model_k in obj._meta.get_all_field_names() and doc[k]:
-                field_type = obj._meta.get_field(model_k).get_internal_type()
+        qs = cls.get_extraction_queryset(database)
+        lookup = '{0}__in'.format(cls.id_field)
+        for chunk in chunked(ids, chunk_size or cls.extract_chunk_size):
+            for obj in qs.filter(**{lookup: chunk}):
+                yield cls.extract_document(getattr(obj, cls.id_field), obj)
 
-                if field_type == 'ForeignKey' and \
-                   'properties' in cls.get_field_mapping()[k]:
-                    foreign_obj = doc[k]
-                    doc[k] = {}
+    @classmethod
+    def compile_values_plan(cls):
+        """Returns ``(columns, plan, nested)`` to extract documents from
+        `values_list` rows:
 
-                    for k_field in cls.get_field_mapping()[k]['properties']:
-                        k_1, doc[k][k_field] = cls.serialize_field(foreign_obj, k_field)  # noqa
+            - columns: column paths to select, ex.: 'author__username',
+            - plan: list of ``(key, accessor)`` reading a row,
+            - nested: list of ``(key, lookup, fields)`` for related managers.
 
-        return doc
+        Raises ImproperlyConfigured for keys which are not model fields.
+        """
+        mapping = cls.get_field_mapping()
+        opts = cls.get_model()._meta
+
+        columns = [cls.id_field]
+
+        def column(*path):
+            path = '__'.join(path)
+            if path not in columns:
+                columns.append(path)
+            return columns.index(path)
+
+        plan, nested = [], []
+        for k in [cls.id_field] + [k for k in mapping.keys()
+                                   if k != cls.id_field]:
+            k_1, k_2 = cls.split_key(k)
+            try:
+                field, model, direct, m2m = opts.get_field_by_name(k_1)
+            except FieldDoesNotExist:
+                raise ImproperlyConfigured(
+                    '{0} is not a {1} field, it can not be extracted from '
+                    'values.'.format(k_1, opts.object_name))
+
+            if k == cls.id_field:
+                plan.append((k, _stringify(itemgetter(column(k_1)))))
+            elif (m2m or not direct) and k_2 is None:
+                # reverse relations are looked up by their query name
+                lookup = k_1 if direct else field.field.related_query_name()
+                nested.append((k, lookup,
+                               list(cls.get_nested_fields(field=k))))
+            elif k_2 is not None:
+                plan.append((k, itemgetter(column(k_1, k_2))))
+            elif field.get_internal_type() == 'ForeignKey' and \
+                    'properties' in mapping[k]:
+                plan.append((k, _row_sub_document(
+                    column(k_1),
+                    [(p, column(k_1, *p.split(cls.rel_sep)))
+                     for p in mapping[k]['properties']])))
+            elif field.rel:
+                raise ImproperlyConfigured(
+                    '{0} is a relation without mapped properties, it can not '
+                    'be extracted from values.'.format(k_1))
+            else:
+                plan.append((k, itemgetter(column(k_1))))
+
+        return columns, plan, nested
+
+    @classmethod
+    def get_values_plan(cls):
+        """Returns the values plan compiled once per mapping type."""
+        # own attribute only, subclasses compile their own plan
+        if cls.__dict__.get('_values_plan') is None:
+            cls._values_plan = cls.compile_values_plan()
+        return cls._values_plan
+
+    @classmethod
+    def extract_documents_from_values(cls, ids, chunk_size=None,
+                                      database=None):
+        """Yields json docs to index for the given pks, built from
+        `values_list` rows: one query per chunk plus one grouped query per
+        related manager, without instantiating any model.
+
+        Documents are the same as `extract_document` ones.
+
+        :params ids: pks of the objects to extract.
+        :params chunk_size: default=extract_chunk_size.
+        :params database: database alias to read from.
+        """
+        columns, plan, nested = cls.get_values_plan()
+        qs = cls.get_model().objects.using(database).order_by(cls.id_field)
+        lookup = '{0}__in'.format(cls.id_field)
+
+        for chunk in chunked(ids, chunk_size or cls.extract_chunk_size):
+            rows = qs.filter(**{lookup: chunk}).values_list(*columns)
+            for doc in cls.extract_values_rows(rows, database=database):
+                yield doc
+
+    @classmethod
+    def extract_values_rows(cls, rows, database=None):
+        """Yields json docs of `values_list` rows selecting the values plan
+        columns, querying related managers values once for all the rows."""
+        columns, plan, nested = cls.get_values_plan()
+        rows = list(rows)
+        if not rows:
+            return
+
+        # group related values by object pk
+        related = {}
+        rel_qs = cls.get_model().objects.using(database).filter(**{
+            '{0}__in'.format(cls.id_field): [row[0] for row in rows]})
+        for k, rel, fields in nested:
+            related[k] = grouped = {}
+            rel_pk = '{0}__pk'.format(rel)
+            rel_rows = rel_qs.values_list(
+                cls.id_field, rel_pk,
+                *['{0}__{1}'.format(rel, f) for f in fields])
+            for row in rel_rows.order_by(cls.id_field, rel_pk):
+                items = grouped.setdefault(row[0], [])
+                # no related object at all
+                if row[1] is not None:
+                    items.append(dict(zip(fields, row[2:])))
+
+        for row in rows:
+            doc = dict((k, accessor(row)) for k, accessor in plan)
+            for k in related:
+                doc[k] = related[k].get(row[0], [])
+            yield doc
+
+    @classmethod
+    def iter_documents(cls, chunk_size=None, database=None):
+        """Yields json docs of all the objects.
+
+        Rows are read once, by chunks walking the id_field keyset, so that
+        memory does not depend on the table size.
+
+        :params chunk_size: default=extract_chunk_size.
+        :params database: database alias to read from.
+        """
+        chunk_size = chunk_size or cls.extract_chunk_size
+        gt_lookup = '{0}__gt'.format(cls.id_field)
+
+        if cls.extraction_mode == 'values':
+            qs = cls.get_model().objects.using(database)
+            qs = qs.values_list(*cls.get_values_plan()[0])
+        else:
+            qs = cls.get_extraction_queryset(database)
+        qs = qs.order_by(cls.id_field)
+
+        chunk = list(qs[:chunk_size])
+        while chunk:
+            if cls.extraction_mode == 'values':
+                last_id = chunk[-1][0]
+                docs = cls.extract_values_rows(chunk, database=database)
+            else:
+                last_id = getattr(chunk[-1], cls.id_field)
+                docs = (cls.extract_document(getattr(obj, cls.id_field), obj)
+                        for obj in chunk)
+
+            for doc in docs:
+                yield doc
+
+            chunk = list(qs.filter(**{gt_lookup: last_id})[:chunk_size])
 
     @classmethod
     def search(cls):
@@ -222,7 +1142,8 @@ class SearchMappingType(MappingType, Indexable):
         }) for doc_type in settings.ES_DOC_TYPES])
 
     @classmethod
-    def create_index(cls, es=None, index=None, mappings=None):
+    def create_index(cls, es=None, index=None, mappings=None,
+                     index_settings=None):
 
         # ensure es and index values
         es = es or cls.get_es()
@@ -233,10 +1154,155 @@ class SearchMappingType(MappingType, Indexable):
             mappings = mappings or cls.generate_mappings()
             # do create
             es.indices.create(index, body={
-                'settings': settings.ES_INDEX_SETTINGS,
+                'settings': cls.get_index_settings(index_settings),
                 'mappings': mappings,
             })
 
+    @classmethod
+    def get_versioned_index(cls, alias=None):
+        """Returns a new index name for the alias, ex.:
+        'demo_esutils_20141016161920000000'."""
+        return '{0}_{1}'.format(alias or cls.get_index(),
+                                datetime.utcnow().strftime('%Y%m%d%H%M%S%f'))
+
+    @classmethod
+    def get_aliased_indexes(cls, es=None, alias=None):
+        """Returns the names of the indexes behind the alias."""
+        es = es or cls.get_es()
+        alias = alias or cls.get_index()
+        try:
+            return sorted(es.indices.get_alias(name=alias).keys())
+        except NotFoundError:
+            return []
+
+    @classmethod
+    def get_serving_index_settings(cls):
+        """Returns the index settings to restore once a new index is loaded.
+        """
+        index_settings = settings.ES_INDEX_SETTINGS.get('index', {})
+        return {
+            'refresh_interval': index_settings.get('refresh_interval', '1s'),
+            'number_of_replicas': index_settings.get('number_of_replicas', 1),
+        }
+
+    @classmethod
+    def rebuild_index(cls, mapping_types=None, es=None, keep_previous=False,
+                      chunk_size=None, database='default', in_flight=2):
+        """Rebuilds the index behind the `get_index` alias without downtime:
+
+            - creates a new versioned index with the mapping types mappings
+              and bulk loading settings (no refresh, no replica),
+            - loads every mapping type with `run_index_streaming`,
+            - replays objects modified during the load with
+              `run_index_delta`, for mapping types with an updated_field,
+            - restores serving settings,
+            - replays objects modified since the first replay, then
+              atomically moves the alias to the new index,
+            - replays them again, writes made meanwhile went to the
+              previous index,
+            - deletes previous indexes unless keep_previous.
+
+        Readers keep searching the previous index until the alias moves. The
+        new index is deleted if its load fails, the live one is untouched.
+
+        .. Note::
+
+            A concrete index named as the alias is deleted just before the
+            first swap, since an alias can not shadow an index. Changes of
+            mapping types without updated_field made during the load are not
+            replayed.
+
+        :params mapping_types: mapping types stored in the index,
+            default=[cls].
+
+        Returns the new index name.
+        """
+        mapping_types = mapping_types or [cls]
+        es = es or cls.get_es()
+        alias = cls.get_index()
+        index = cls.get_versioned_index(alias)
+
+        index_settings = None
+        for m_type in mapping_types:
+            index_settings = m_type.get_index_settings(index_settings)
+        index_settings.setdefault('index', {}).update(
+            cls.bulk_load_index_settings)
+        cls.create_index(es=es, index=index, index_settings=index_settings,
+                         mappings=dict((m.doc_type(), m.get_mapping())
+                                       for m in mapping_types))
+
+        def replay(since):
+            # objects saved or deleted since went to the live index only
+            result = bulk.BulkResult()
+            for m_type in mapping_types:
+                if m_type.updated_field:
+                    result.update(m_type.run_index_delta(
+                        since=since, chunk_size=chunk_size,
+                        database=database, es=es, index=index,
+                        checkpoint=False))
+            return result
+
+        def check(result):
+            if result.errors:
+                raise BulkIndexError(
+                    '{0} documents failed to index in {1}.'.format(
+                        len(result.errors), index), result.errors)
+
+        try:
+            started = now()
+            result = bulk.BulkResult()
+            for m_type in mapping_types:
+                result.update(m_type.run_index_streaming(
+                    chunk_size=chunk_size, database=database,
+                    in_flight=in_flight, es=es, index=index) or
+                    bulk.BulkResult())
+
+            replayed = now()
+            result.update(replay(started))
+            check(result)
+
+            es.indices.put_settings(
+                {'index': cls.get_serving_index_settings()}, index=index)
+            es.indices.refresh(index=index)
+            es.cluster.health(index=index, wait_for_status='yellow')
+
+            check(replay(replayed))
+        except Exception:
+            es.indices.delete(index)
+            raise
+
+        previous = cls.get_aliased_indexes(es=es, alias=alias)
+        concrete = not previous and es.indices.exists(alias)
+        if concrete:
+            es.indices.delete(alias)
+
+        actions = [{'remove': {'index': i, 'alias': alias}} for i in previous]
+        actions.append({'add': {'index': index, 'alias': alias}})
+        try:
+            es.indices.update_aliases({'actions': actions})
+        except TransportError:
+            if not concrete:
+                # the alias still points to the previous indexes
+                es.indices.delete(index)
+                raise
+            # nothing is served since the concrete index is deleted
+            log.exception('Failed to alias %s to %s, retrying.', alias,
+                          index)
+            es.indices.put_alias(index=index, name=alias)
+        cls.bump_write_generation()
+
+        result = replay(replayed)
+        if result.errors:
+            log.error('{0} documents modified during the swap failed to '
+                      'index in {1}: {2}'.format(len(result.errors), index,
+                                                 result.errors[:10]))
+
+        if not keep_previous:
+            for i in previous:
+                es.indices.delete(i)
+
+        return index
+
     @classmethod
     def update_mapping(cls, es=None, index=None, doc_type=None, mapping=None,
                        delete_previous_mapping=True):
@@ -261,12 +1327,169 @@ class SearchMappingType(MappingType, Indexable):
         es.indices.put_mapping(doc_type, {
             doc_type: mapping
         }, index=index)
+        cls.bump_write_generation(index)
+
+    @classmethod
+    def streaming_bulk(cls, actions, es=None, index=None, in_flight=1):
+        """Sends ``(action, source)`` pairs by bulk requests bounded by
+        bulk_max_docs and bulk_max_bytes, returns a `BulkResult`.
+
+        :params in_flight: max number of concurrent bulk requests.
+        """
+        if getattr(settings, 'ES_DISABLED', False):
+            return bulk.BulkResult()
+        result = bulk.streaming_bulk(es or cls.get_es(),
+                                     actions,
+                                     index=index or cls.get_index(),
+                                     doc_type=cls.get_mapping_type_name(),
+                                     max_docs=cls.bulk_max_docs,
+                                     max_bytes=cls.bulk_max_bytes,
+                                     in_flight=in_flight)
+        if result.requests:
+            cls.bump_write_generation(index)
+        return result
+
+    @classmethod
+    def bulk_index_documents(cls, documents, id_field=None, es=None,
+                             index=None, in_flight=1):
+        """Indexes an iterable of documents by bulk requests.
+
+        Failed documents are reported in the returned `BulkResult` instead of
+        failing (and resending) the whole request.
+        """
+        id_field = id_field or cls.id_field
+        actions = (({'index': {'_id': doc[id_field]}}, doc)
+                   for doc in documents)
+        return cls.streaming_bulk(actions, es=es, index=index,
+                                  in_flight=in_flight)
+
+    @classmethod
+    def bulk_index(cls, documents, id_field='id', es=None, index=None):
+        """Overrides elasticutils bulk_index to send bounded requests."""
+        return cls.bulk_index_documents(documents, id_field=id_field, es=es,
+                                        index=index)
+
+    @classmethod
+    def index(cls, document, id_=None, overwrite_existing=True, es=None,
+              index=None):
+        """Overrides elasticutils index to invalidate cached searches."""
+        super(SearchMappingType, cls).index(
+            document, id_=id_, overwrite_existing=overwrite_existing, es=es,
+            index=index)
+        cls.bump_write_generation(index)
+
+    @classmethod
+    def unindex(cls, id_, es=None, index=None):
+        """Overrides elasticutils unindex to invalidate cached searches."""
+        super(SearchMappingType, cls).unindex(id_, es=es, index=index)
+        cls.bump_write_generation(index)
+
+    @classmethod
+    def bulk_index_ids(cls, ids, es=None, index=None, database=None):
+        """Extracts and indexes objects by bulk requests."""
+        documents = cls.extract_documents(ids, database=database)
+        return cls.bulk_index_documents(documents, es=es, index=index)
+
+    @classmethod
+    def bulk_unindex_ids(cls, ids, es=None, index=None):
+        """Unindexes objects by bulk requests."""
+        actions = (({'delete': {'_id': obj_id}}, None) for obj_id in ids)
+        return cls.streaming_bulk(actions, es=es, index=index)
 
     @classmethod
-    def run_index(cls, ids):
+    def bulk_update_ids(cls, ids, doc, es=None, index=None, database=None):
+        """Partially updates documents by bulk requests, documents missing
+        from the index are extracted and indexed instead.
+
+        :params doc: values to update, ex.: ``{'status': 1}``.
+        """
+        actions = (({'update': {'_id': str(obj_id)}}, {'doc': doc})
+                   for obj_id in ids)
+        result = cls.streaming_bulk(actions, es=es, index=index)
+
+        missing = bulk.get_failed_ids(result, status=404)
+        if missing:
+            result.errors = [entry for entry in result.errors
+                             if str(list(entry.values())[0]['_id'])
+                             not in missing]
+            result.update(cls.bulk_index_ids(list(missing), es=es,
+                                             index=index, database=database))
+        return result
+
+    @classmethod
+    def get_partial_document(cls, values):
+        """Returns the partial document of update values, or None if updated
+        documents have to be extracted again.
+
+        Values of fields mapped as is are converted like the model would load
+        them, values of unmapped fields are ignored. Related fields, computed
+        keys, expressions and the id field require an extraction.
+
+        ..code-block: python
+
+            >>> ArticleMappingType.get_partial_document({'status': '1'})
+            {'status': 1}
+
+            >>> ArticleMappingType.get_partial_document({'category': c})
+            None
+
+        :params values: kwargs of `QuerySet.update`.
+        """
+        if not cls.partial_update:
+            return None
+
+        mapping = cls.get_field_mapping()
+        opts = cls.get_model()._meta
+
+        related = set()
+        for k, v in mapping.items():
+            k_1, k_2 = cls.split_key(k)
+            try:
+                opts.get_field_by_name(k_1)
+            except FieldDoesNotExist:
+                # computed by the model, may depend on any field
+                return None
+            if k_2 is not None or 'properties' in v:
+                related.add(k_1)
+
+        doc = {}
+        for name, value in values.items():
+            # F() expressions, their result is only known by the database
+            if hasattr(value, 'evaluate') or \
+                    hasattr(value, 'resolve_expression'):
+                return None
+            if name == cls.id_field or name in related:
+                return None
+            if name not in mapping:
+                continue
+            field = opts.get_field(name)
+            if field.rel:
+                return None
+            doc[name] = field.to_python(value)
+        return doc
+
+    @classmethod
+    def run_partial_update(cls, ids, doc, database=None):
+        """Sends a partial update job, see `bulk_update_ids`."""
         if not ids:
             return
-        tasks.index_objects.delay(cls, ids)
+        # buffered and outbox operations are full indexing
+        if get_index_buffer() is not None or cls.use_outbox:
+            cls.run_index(ids, database=database)
+            return
+        bulk_update_objects.delay(cls, ids, doc, database=database)
+
+    @classmethod
+    def run_index(cls, ids, database=None):
+        if not ids:
+            return
+        # sent once the current `coalesce_indexing` block commits
+        if buffer_ids(cls, ids, 'index', database=database):
+            return
+        if cls.use_outbox:
+            outbox.push(cls, ids, 'index', database=database)
+            return
+        bulk_index_objects.delay(cls, ids, database=database)
 
     @classmethod
     def run_index_all(cls, number=1000, database='default'):
@@ -274,33 +1497,279 @@ class SearchMappingType(MappingType, Indexable):
             return
         pk = 0
         last_pk = cls.get_model().objects.using(database).order_by('-pk')[0].pk
-        qs = cls.get_model().objects.order_by('pk')
+        qs = cls.get_model().objects.using(database).order_by('pk')
         while pk < last_pk:
             ids = list(qs.filter(pk__gt=pk)[:number].values_list(cls.id_field,
                                                                  flat=True))
-            cls.run_index(ids)
+            cls.run_index(ids, database=database)
             pk = ids[-1]
 
+    @classmethod
+    def run_index_streaming(cls, chunk_size=None, database='default',
+                            in_flight=2, es=None, index=None):
+        """Indexes all the objects in a single pipeline: rows are read once
+        by chunks, extracted lazily and sent by bulk requests, at most
+        `in_flight` of them being sent concurrently. Memory stays bounded
+        whatever the table size. Returns a `BulkResult`.
+        """
+        if database not in settings.DATABASES:
+            return
+        documents = cls.iter_documents(chunk_size=chunk_size,
+                                       database=database)
+        return cls.bulk_index_documents(documents, es=es, index=index,
+                                        in_flight=in_flight)
+
+    @classmethod
+    def get_delta_checkpoint(cls, database='default'):
+        """Returns the last modification date indexed by `run_index_delta`,
+        None if it never ran."""
+        checkpoint = IndexCheckpoint.objects.using(database).filter(
+            mapping_type=cls.get_mapping_type_path()).first()
+        return checkpoint.timestamp if checkpoint else None
+
+    @classmethod
+    def set_delta_checkpoint(cls, timestamp, database='default'):
+        checkpoints = IndexCheckpoint.objects.using(database).filter(
+            mapping_type=cls.get_mapping_type_path())
+        if not checkpoints.update(timestamp=timestamp):
+            checkpoints.create(mapping_type=cls.get_mapping_type_path(),
+                               timestamp=timestamp)
+
+    @classmethod
+    def run_index_delta(cls, since=None, chunk_size=None, database='default',
+                        es=None, index=None, checkpoint=True):
+        """Indexes objects modified since the stored checkpoint, or since,
+        and unindexes the tombstoned ones. Returns a `BulkResult`.
+
+        Objects are walked by modification date and the checkpoint moves
+        after each chunk, so that an interrupted run resumes where it
+        stopped. It stops moving on the first chunk with failures.
+
+        :params checkpoint: if False, replays changes since `since` into
+            another index, ex.: by `rebuild_index`, leaving the checkpoint
+            and tombstones to the delta sync of the live index.
+        """
+        if not cls.updated_field:
+            raise ImproperlyConfigured(
+                '{0}.updated_field is required for delta sync.'.format(
+                    cls.__name__))
+        chunk_size = chunk_size or cls.extract_chunk_size
+        result = bulk.BulkResult()
+
+        since = since or cls.get_delta_checkpoint(database=database)
+        qs = cls.get_model().objects.using(database)
+        if since is not None:
+            qs = qs.filter(**{'{0}__gt'.format(cls.updated_field):
+                              since - cls.delta_overlap})
+        qs = qs.order_by(cls.updated_field, cls.id_field)
+        qs = qs.values_list(cls.updated_field, cls.id_field)
+
+        rows = list(qs[:chunk_size])
+        while rows:
+            chunk_result = cls.bulk_index_ids([r[1] for r in rows], es=es,
+                                              index=index, database=database)
+            result.update(chunk_result)
+            if chunk_result.errors:
+                return result
+
+            last_date, last_id = rows[-1]
+            if checkpoint:
+                cls.set_delta_checkpoint(last_date, database=database)
+            rows = list(qs.filter(
+                Q(**{'{0}__gt'.format(cls.updated_field): last_date}) |
+                Q(**{cls.updated_field: last_date,
+                     '{0}__gt'.format(cls.id_field): last_id}))[:chunk_size])
+
+        tombstones = IndexTombstone.objects.using(database).filter(
+            mapping_type=cls.get_mapping_type_path()).order_by('pk')
+        if not checkpoint and since is not None:
+            tombstones = tombstones.filter(
+                deleted_at__gt=since - cls.delta_overlap)
+        rows = list(tombstones.values_list('pk', 'object_id')[:chunk_size])
+        while rows:
+            chunk_result = cls.bulk_unindex_ids([r[1] for r in rows], es=es,
+                                                index=index)
+            result.update(chunk_result)
+            if chunk_result.errors:
+                return result
+
+            if checkpoint:
+                tombstones.filter(pk__in=[r[0] for r in rows]).delete()
+            rows = list(tombstones.filter(pk__gt=rows[-1][0]).values_list(
+                'pk', 'object_id')[:chunk_size])
+
+        return result
+
+    @classmethod
+    def get_pk_partitions(cls, partitions, database='default'):
+        """Splits the model pk range in at most `partitions` contiguous
+        ``(min_pk, max_pk)`` ranges, bounds included. Raises
+        `ImproperlyConfigured` if the model pks are not integers.
+
+        ..code-block: python
+
+            >>> ArticleMappingType.get_pk_partitions(2)
+            [(1, 2), (3, 4)]
+        """
+        bounds = cls.get_model().objects.using(database).aggregate(
+            min_pk=Min('pk'), max_pk=Max('pk'))
+        min_pk, max_pk = bounds['min_pk'], bounds['max_pk']
+        if min_pk is None:
+            return []
+        if not isinstance(min_pk, six.integer_types) or \
+                not isinstance(max_pk, six.integer_types):
+            raise ImproperlyConfigured(
+                '{0} cannot be partitioned by pk ranges, its pks are not '
+                'integers'.format(cls.get_mapping_type_name()))
+        size = int(math.ceil((max_pk - min_pk + 1) / float(partitions)))
+        return [(start, min(start + size - 1, max_pk))
+                for start in range(min_pk, max_pk + 1, size)]
+
+    @classmethod
+    def index_partition(cls, min_pk, max_pk, number=1000,
+                        database='default'):
+        """Indexes objects whose pk is in ``[min_pk, max_pk]``, walking pks
+        by pages of `number` objects. Returns a `BulkResult`."""
+        qs = cls.get_model().objects.using(database).order_by('pk')
+        qs = qs.filter(pk__gte=min_pk, pk__lte=max_pk)
+
+        result = bulk.BulkResult()
+        page = qs
+        while True:
+            rows = list(page[:number].values_list('pk', cls.id_field))
+            if not rows:
+                break
+            result.update(cls.bulk_index_ids([r[1] for r in rows],
+                                             database=database))
+            log.info('{0} [{1}-{2}]: {3} indexed, {4} errors'.format(
+                cls.get_mapping_type_name(), min_pk, max_pk,
+                result.success, len(result.errors)))
+            page = qs.filter(pk__gt=rows[-1][0])
+        return result
+
+    @classmethod
+    def run_index_partitioned(cls, partitions=4, number=1000,
+                              database='default', backend='process'):
+        """Indexes all the objects, splitting the pk range in `partitions`
+        ranges indexed concurrently.
+
+        :params backend: 'process' to index in a local process pool, returns
+            a list of ``((min_pk, max_pk), BulkResult)``; 'celery' to send a
+            celery group of `index_partition` tasks, returns its result.
+
+        .. Note::
+
+            The 'process' backend closes the database connections before
+            forking, it raises `TransactionManagementError` when called
+            inside an atomic block.
+        """
+        if database not in settings.DATABASES:
+            return
+        if backend == 'process' and any(conn.in_atomic_block
+                                        for conn in connections.all()):
+            raise TransactionManagementError(
+                'run_index_partitioned cannot fork inside an atomic block, '
+                'use the celery backend or call it after the commit')
+        ranges = cls.get_pk_partitions(partitions, database=database)
+
+        if backend == 'celery':
+            return group(index_partition.s(cls, min_pk, max_pk,
+                                           number=number,
+                                           database=database)
+                         for min_pk, max_pk in ranges).apply_async()
+
+        if not ranges:
+            return []
+
+        # forked workers must not share the parent connections
+        for conn in connections.all():
+            conn.close()
+
+        pool = Pool(len(ranges))
+        try:
+            results = pool.map(_index_partition,
+                               [(cls, min_pk, max_pk, number, database)
+                                for min_pk, max_pk in ranges])
+        finally:
+            pool.close()
+            pool.join()
+        return list(zip(ranges, results))
+
     @classmethod
     def run_unindex(cls, ids):
         if not ids:
             return
-        tasks.unindex_objects.delay(cls, ids)
+        if buffer_ids(cls, ids, 'unindex'):
+            return
+        if cls.use_outbox:
+            outbox.push(cls, ids, 'unindex')
+            return
+        bulk_unindex_objects.delay(cls, ids)
 
     @classmethod
     def on_post_save(cls, sender, instance, **kwargs):
         """Indexes passed object when call from a model post_save signal.
         """
+        cls.invalidate_hydration_cache([getattr(instance, cls.id_field)])
         cls.run_index([getattr(instance, cls.id_field)])
 
     @classmethod
-    def on_post_update(cls, sender, queryset, **kwargs):
-        """Indexes passed object when call from a model post_save signal.
+    def on_post_update(cls, sender, queryset, ids=None, values=None,
+                       **kwargs):
+        """Indexes updated objects when call from a post_update signal.
+
+        Documents are partially updated if the updated fields are mapped as
+        is, see `get_partial_document`, or left untouched if none of them is
+        mapped.
         """
-        cls.run_index(list(queryset.values_list(cls.id_field, flat=True)))
+        if ids is None or not cls.id_field_is_pk():
+            ids = list(queryset.values_list(cls.id_field, flat=True))
+        cls.invalidate_hydration_cache(ids)
+
+        doc = cls.get_partial_document(values) if values else None
+        if doc is None:
+            cls.run_index(ids)
+        elif doc:
+            cls.run_partial_update(ids, doc)
+
+    @classmethod
+    def on_post_bulk_create(cls, sender, queryset, ids, **kwargs):
+        """Indexes created objects when call from a post_bulk_create signal.
+        """
+        if not cls.id_field_is_pk():
+            ids = list(queryset.values_list(cls.id_field, flat=True))
+        cls.run_index(ids)
 
     @classmethod
     def on_post_delete(cls, sender, instance, **kwargs):
         """Unindexes passed object when call from a model post_delete signal.
         """
-        cls.run_unindex([getattr(instance, cls.id_field)])
+        # unindexed with the other deleted objects by on_post_bulk_delete
+        if cls.id_field_is_pk() and in_bulk_delete(sender):
+            return
+        obj_id = getattr(instance, cls.id_field)
+        cls.invalidate_hydration_cache([obj_id])
+        # keep a tombstone for the delta sync
+        if cls.use_tombstones:
+            IndexTombstone.objects.using(kwargs.get('using')).create(
+                mapping_type=cls.get_mapping_type_path(), object_id=obj_id)
+        cls.run_unindex([obj_id])
+
+    @classmethod
+    def on_post_bulk_delete(cls, sender, ids, **kwargs):
+        """Unindexes deleted objects when call from a post_bulk_delete
+        signal.
+
+        Signaled ids are pks, objects of mapping types with another id_field
+        are unindexed by on_post_delete.
+        """
+        if not cls.id_field_is_pk():
+            return
+        cls.invalidate_hydration_cache(ids)
+        # keep tombstones for the delta sync
+        if cls.use_tombstones:
+            IndexTombstone.objects.using(kwargs.get('using')).bulk_create([
+                IndexTombstone(mapping_type=cls.get_mapping_type_path(),
+                               object_id=obj_id)
+                for obj_id in ids])
+        cls.run_unindex(ids)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexCheckpoint',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False,
+                                        auto_created=True, primary_key=True)),
+                ('mapping_type', models.CharField(unique=True,
+                                                  max_length=255)),
+                ('timestamp', models.DateTimeField()),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='IndexOutbox',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False,
+                                        auto_created=True, primary_key=True)),
+                ('mapping_type', models.CharField(max_length=255)),
+                ('object_id', models.CharField(max_length=255)),
+                ('op', models.CharField(max_length=10, choices=[
+                    (b'index', b'index'), (b'unindex', b'unindex')])),
+                ('database', models.CharField(default=b'', max_length=100,
+                                              blank=True)),
+                ('created_at', models.DateTimeField(
+                    default=django.utils.timezone.now)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='IndexTombstone',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False,
+                                        auto_created=True, primary_key=True)),
+                ('mapping_type', models.CharField(max_length=255,
+                                                  db_index=True)),
+                ('object_id', models.CharField(max_length=255)),
+                ('deleted_at', models.DateTimeField(
+                    default=django.utils.timezone.now)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
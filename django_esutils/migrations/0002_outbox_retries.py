@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_esutils', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexoutbox',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='indexoutbox',
+            name='dead',
+            field=models.BooleanField(default=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='indexoutbox',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now,
+                                       db_index=True),
+            preserve_default=True,
+        ),
+    ]
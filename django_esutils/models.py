@@ -1,32 +1,230 @@
 # -*- coding: utf-8 -*-
+import threading
+from datetime import date
+from datetime import datetime
+from itertools import chain
+
+from django.db import models
+from django.db import transaction
 from django.db.models import Manager
+from django.db.models import Max
 from django.db.models.query import QuerySet
 from django.dispatch import Signal
+from django.utils.timezone import now
+
+from elasticutils.utils import chunked
+
+from django_esutils.transaction import run_on_commit
+
+
+post_update = Signal(providing_args=['queryset', 'ids', 'values'])
+post_bulk_create = Signal(providing_args=['queryset', 'ids'])
+post_bulk_delete = Signal(providing_args=['ids', 'using'])
+
+_state = threading.local()
+
+
+def _get_bulk_deleting():
+    if not hasattr(_state, 'bulk_deleting'):
+        _state.bulk_deleting = []
+    return _state.bulk_deleting
+
+
+def in_bulk_delete(model):
+    """Returns True while `ESQuerySet.delete` deletes rows of model and a
+    post_bulk_delete receiver is connected for it, a post_bulk_delete signal
+    is sent for the objects of its post_delete signals."""
+    return model in _get_bulk_deleting() and \
+        post_bulk_delete.has_listeners(model)
 
 
-post_update = Signal(providing_args=['queryset'])
+def get_auto_now_values(model):
+    """Returns ``{field name: value}`` of the auto_now fields of model, set
+    by `Model.save` but not by `QuerySet.update`."""
+    values = {}
+    for field in model._meta.concrete_fields:
+        if not getattr(field, 'auto_now', False):
+            continue
+        if isinstance(field, models.DateTimeField):
+            values[field.name] = now()
+        elif isinstance(field, models.DateField):
+            values[field.name] = date.today()
+        else:
+            values[field.name] = datetime.now().time()
+    return values
+
+
+def chunked_pks(queryset, chunk_size):
+    """Yields lists of at most chunk_size pks of a queryset, walked in pk
+    order.
+
+    Chunks are read by keyset pagination, one query per chunk, when the
+    previous one has been consumed: rows updated or deleted meanwhile are
+    not read again.
+    """
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    last_pk = None
+    while True:
+        chunk_pks = pks if last_pk is None else pks.filter(pk__gt=last_pk)
+        ids = list(chunk_pks[:chunk_size])
+        if ids:
+            yield ids
+        if len(ids) < chunk_size:
+            return
+        last_pk = ids[-1]
 
 
 class ESQuerySet(QuerySet):
 
+    # max number of pks per statement and signal of update, bulk_create and
+    # delete
+    chunk_size = 500
+
     def update(self, *args, **kwargs):
         """Udpates and sends post_update signal with current self.
+
+        Rows are updated by chunks of chunk_size pks, walked in pk order, and
+        a signal is sent per chunk: statements stay bounded whatever the
+        number of rows. Receivers also get the updated pks as ``ids`` and the
+        update kwargs as ``values``, so that they may skip querying updated
+        rows again.
+
+        Like `Model.save`, auto_now fields are set unless updated values are
+        given, so that the delta sync finds updated rows.
+
+        Chunks are updated in a single transaction, all the rows or none.
+        Signals are sent once it commits, see `run_on_commit`, none if it is
+        rolled back.
         """
-        # keep ids to update
-        ids = list(self.values_list('pk', flat=True))
+        assert self.query.can_filter(), \
+            'Cannot update a query once a slice has been taken.'
 
-        # do update
-        result = super(ESQuerySet, self).update(*args, **kwargs)
+        kwargs = dict(get_auto_now_values(self.model), **kwargs)
+        result = 0
+        chunks = []
+        with transaction.atomic(using=self.db):
+            for ids in chunked_pks(self, self.chunk_size):
+                new_qs = self.filter(pk__in=ids)
+                result += super(ESQuerySet, new_qs).update(*args, **kwargs)
+                chunks.append(ids)
 
-        # call signal with queryset matching the update
-        new_qs = self.model.objects.filter(pk__in=ids)
-        # trigger signal
-        post_update.send(sender=self.model, queryset=new_qs)
+        def send():
+            for ids in chunks:
+                # call signal with queryset matching the update
+                new_qs = self.model.objects.filter(pk__in=ids)
+                post_update.send(sender=self.model, queryset=new_qs, ids=ids,
+                                 values=kwargs)
+        run_on_commit(send, using=self.db)
 
         return result
 
+    def bulk_create(self, objs, batch_size=None):
+        """Inserts objects and sends a post_bulk_create signal per chunk of
+        chunk_size created pks.
+
+        Objects without pk do not get one from `bulk_create`, rows inserted
+        after the last pk are signaled instead, including rows concurrently
+        inserted.
+        """
+        objs = list(objs)
+        if not objs:
+            return objs
+
+        manager = self.model._base_manager.using(self.db)
+        last_pk = None
+        if self.model._meta.has_auto_field and \
+                any(obj.pk is None for obj in objs):
+            last_pk = manager.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+
+        objs = super(ESQuerySet, self).bulk_create(objs,
+                                                   batch_size=batch_size)
+
+        ids = [obj.pk for obj in objs if obj.pk is not None and
+               (last_pk is None or obj.pk <= last_pk)]
+        if last_pk is not None:
+            chunks = chunked_pks(manager.filter(pk__gt=last_pk),
+                                 self.chunk_size)
+            chunks = chain(chunked(ids, self.chunk_size), chunks)
+        else:
+            chunks = chunked(ids, self.chunk_size)
+
+        for ids in chunks:
+            new_qs = self.model.objects.filter(pk__in=ids)
+            post_bulk_create.send(sender=self.model, queryset=new_qs, ids=ids)
+
+        return objs
+
+    def delete(self):
+        """Deletes by chunks of chunk_size pks and sends a post_bulk_delete
+        signal per chunk.
+
+        Models post_delete signals are still sent, `in_bulk_delete` tells
+        receivers a post_bulk_delete signal follows. Chunks are deleted in a
+        single transaction, post_bulk_delete signals are sent once it
+        commits, see `run_on_commit`.
+        """
+        assert self.query.can_filter(), \
+            "Cannot use 'limit' or 'offset' with delete."
+
+        chunks = []
+        bulk_deleting = _get_bulk_deleting()
+        bulk_deleting.append(self.model)
+        try:
+            with transaction.atomic(using=self.db):
+                for ids in chunked_pks(self, self.chunk_size):
+                    super(ESQuerySet, self.filter(pk__in=ids)).delete()
+                    chunks.append(ids)
+        finally:
+            bulk_deleting.remove(self.model)
+
+        def send():
+            for ids in chunks:
+                post_bulk_delete.send(sender=self.model, ids=ids,
+                                      using=self.db)
+        run_on_commit(send, using=self.db)
+
+        # Clear the result cache, in case this QuerySet gets reused.
+        self._result_cache = None
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 class ESManager(Manager):
 
     def get_queryset(self):
         return ESQuerySet(self.model, using=self._db)
+
+
+class IndexCheckpoint(models.Model):
+    """Last modification date indexed by the delta sync of a mapping type.
+    """
+    mapping_type = models.CharField(max_length=255, unique=True)
+    timestamp = models.DateTimeField()
+
+
+class IndexTombstone(models.Model):
+    """Object deleted from the database, unindexed by the next delta sync of
+    its mapping type."""
+    mapping_type = models.CharField(max_length=255, db_index=True)
+    object_id = models.CharField(max_length=255)
+    deleted_at = models.DateTimeField(default=now)
+
+
+class IndexOutbox(models.Model):
+    """Index operation waiting for the outbox drainer, see
+    `django_esutils.outbox`."""
+    OPS = (
+        ('index', 'index'),
+        ('unindex', 'unindex'),
+    )
+    mapping_type = models.CharField(max_length=255)
+    object_id = models.CharField(max_length=255)
+    op = models.CharField(max_length=10, choices=OPS)
+    # alias documents are read from, default routing if blank
+    database = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(default=now)
+    # failed drains, the row is not claimed before next_attempt_at and is
+    # dead, never claimed again, after too many attempts
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now, db_index=True)
+    dead = models.BooleanField(default=False)
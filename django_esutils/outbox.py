@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Durable indexing outbox.
+
+Mapping types with ``use_outbox = True`` store their index operations as
+`IndexOutbox` rows, in the transaction of the change, instead of sending
+celery tasks. `drain_outbox` claims them by large batches, collapses
+duplicates and sends bulk requests.
+
+Rows of failed items are retried with an exponential backoff, then marked
+dead: they are kept for inspection and never claimed again.
+"""
+import inspect
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db import router
+from django.db import transaction
+from django.db.models.query import QuerySet
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from django_esutils.bulk import BulkResult
+from django_esutils.bulk import get_failed_ids
+from django_esutils.models import IndexOutbox
+
+
+log = logging.getLogger('django_esutils')
+
+# SKIP LOCKED lets concurrent drainers claim distinct rows, Django >= 1.11
+SKIP_LOCKED = 'skip_locked' in inspect.getargspec(
+    QuerySet.select_for_update).args
+
+_mapping_types = {}
+
+
+def get_mapping_type(path):
+    """Returns the mapping type class of a dotted path."""
+    if path not in _mapping_types:
+        _mapping_types[path] = import_string(path)
+    return _mapping_types[path]
+
+
+def push(mapping_type, ids, op, database=None):
+    """Stores index operations of a mapping type in the outbox, written to
+    the database the router selects for `IndexOutbox`.
+
+    :params database: alias documents are read from when drained.
+    """
+    IndexOutbox.objects.using(router.db_for_write(IndexOutbox)).bulk_create([
+        IndexOutbox(mapping_type=mapping_type.get_mapping_type_path(),
+                    object_id=obj_id, op=op, database=database or '')
+        for obj_id in ids])
+
+
+def get_retry_delay(attempts, retry_delay=10, max_retry_delay=3600):
+    """Returns the seconds to wait before the next attempt of a row failed
+    attempts times, doubled after each attempt."""
+    return min(retry_delay * 2 ** (attempts - 1), max_retry_delay)
+
+
+def retry_rows(qs, max_attempts, retry_delay):
+    """Schedules the next attempt of failed outbox rows, rows failed
+    max_attempts times are marked dead."""
+    attempts = {}
+    for pk, count in qs.values_list('pk', 'attempts'):
+        attempts.setdefault(count + 1, []).append(pk)
+
+    for count, pks in attempts.items():
+        rows = qs.filter(pk__in=pks)
+        if count >= max_attempts:
+            log.error('{0} outbox rows dead after {1} attempts.'.format(
+                len(pks), count))
+            rows.update(attempts=count, dead=True)
+        else:
+            rows.update(attempts=count, next_attempt_at=now() + timedelta(
+                seconds=get_retry_delay(count, retry_delay)))
+
+
+def drain_outbox(batch_size=5000, database='default', max_attempts=10,
+                 retry_delay=10):
+    """Claims up to batch_size outbox rows, sends them by bulk requests and
+    deletes them.
+
+    Rows of failed items are retried after `get_retry_delay` seconds, rows
+    failed max_attempts times are marked dead.
+
+    :params database: alias of the outbox table, documents are read from the
+        alias stored in rows.
+
+    Returns a ``(claimed rows count, BulkResult)`` tuple.
+    """
+    result = BulkResult()
+    with transaction.atomic(using=database):
+        qs = IndexOutbox.objects.using(database).filter(
+            dead=False, next_attempt_at__lte=now()).order_by('pk')
+        qs = qs.select_for_update(**({'skip_locked': True}
+                                     if SKIP_LOCKED else {}))
+        rows = list(qs[:batch_size].values_list('pk', 'mapping_type',
+                                                'database', 'object_id',
+                                                'op'))
+
+        # collapse duplicates, the last operation on an object wins
+        jobs = OrderedDict()
+        for pk, path, read_db, obj_id, op in rows:
+            ops = jobs.setdefault((path, read_db), OrderedDict())
+            ops.pop(obj_id, None)
+            ops[obj_id] = op
+
+        kept = set()
+        for (path, read_db), ops in jobs.items():
+            mapping_type = get_mapping_type(path)
+            path_result = mapping_type.bulk_unindex_ids(
+                [obj_id for obj_id, op in ops.items() if op == 'unindex'])
+            path_result.update(mapping_type.bulk_index_ids(
+                [obj_id for obj_id, op in ops.items() if op == 'index'],
+                database=read_db or None))
+            result.update(path_result)
+
+            failed = get_failed_ids(path_result)
+            kept.update(row[0] for row in rows
+                        if row[1:3] == (path, read_db) and row[3] in failed)
+
+        outbox = IndexOutbox.objects.using(database)
+        outbox.filter(
+            pk__in=[row[0] for row in rows if row[0] not in kept]).delete()
+        if kept:
+            retry_rows(outbox.filter(pk__in=kept), max_attempts,
+                       retry_delay)
+
+    if rows:
+        log.info('{0} outbox rows drained: {1}'.format(len(rows), result))
+    return len(rows), result
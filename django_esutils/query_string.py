@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Parser of the ``field:value`` query string syntax of filter sets.
+
+..code-block: text
+
+    amaz                        full text, see the all filter
+    subject:amazing             term, or the search action of the field
+    subject:"amazing article"   quoted value, \\" escapes a quote
+    status:[1 TO 2]             range, bounds included
+    status:{1 TO 2]             lower bound excluded, * for no bound
+    status:>=1                  comparison: >, >=, < or <=
+    -status:1                   negation
+
+Terms are separated by spaces, values may contain colons, ex.:
+``url:http://example.com``.
+"""
+import re
+from collections import namedtuple
+
+from django_esutils.cache import LRUCache
+
+
+# compiled filters of query strings, see
+# `ElasticutilsFilterSet.get_filter_query_string`
+query_string_cache = LRUCache(max_size=1000, timeout=None)
+
+
+class QueryStringError(ValueError):
+    """The query string can not be parsed."""
+
+
+# action is None or 'range', value of a range being a dict of bounds,
+# ex.: {'gte': '1', 'lt': '2'}
+Term = namedtuple('Term', ['field', 'value', 'action', 'negate'])
+
+
+_QUOTED = r'"(?:[^"\\]|\\.)*"'
+
+_TERM_RE = re.compile(r'''
+    (?P<negate>-)?
+    (?:(?P<field>\w[\w.]*):)?
+    (?:
+        (?P<open>[\[{{])\s*
+        (?P<lower>{quoted}|[^\s"\]}}]+)\s+TO\s+
+        (?P<upper>{quoted}|[^\s"\]}}]+)\s*
+        (?P<close>[\]}}])
+    |
+        (?P<op>[<>]=?)?
+        (?P<value>{quoted}|[^\s"\[{{][^\s"]*)
+    )
+    (?=\s|$)
+'''.format(quoted=_QUOTED), re.VERBOSE | re.UNICODE)
+
+_ESCAPE_RE = re.compile(r'\\(.)')
+
+_OPERATORS = {
+    '>': 'gt',
+    '>=': 'gte',
+    '<': 'lt',
+    '<=': 'lte',
+}
+
+
+def unquote(value):
+    if value.startswith('"'):
+        return _ESCAPE_RE.sub(r'\1', value[1:-1])
+    return value
+
+
+def get_range(match):
+    bounds = {}
+    if match.group('lower') != '*':
+        action = 'gte' if match.group('open') == '[' else 'gt'
+        bounds[action] = unquote(match.group('lower'))
+    if match.group('upper') != '*':
+        action = 'lte' if match.group('close') == ']' else 'lt'
+        bounds[action] = unquote(match.group('upper'))
+    return bounds
+
+
+def parse_query_string(query_str):
+    """Returns the `Term` list of a query string.
+
+    ..code-block: python
+
+        >>> parse_query_string('amaz -status:[1 TO *]')
+        [Term(field=None, value='amaz', action=None, negate=False),
+         Term(field='status', value={'gte': '1'}, action='range',
+              negate=True)]
+
+    Raises `QueryStringError` if it can not be parsed.
+    """
+    terms = []
+    pos, end = 0, len(query_str)
+    while True:
+        # skip spaces
+        while pos < end and query_str[pos].isspace():
+            pos += 1
+        if pos == end:
+            return terms
+
+        match = _TERM_RE.match(query_str, pos)
+        if match is None:
+            raise QueryStringError(
+                'Invalid query string at {0}: {1!r}'.format(
+                    pos, query_str[pos:]))
+        pos = match.end()
+
+        field = match.group('field')
+        negate = bool(match.group('negate'))
+        if match.group('open'):
+            value, action = get_range(match), 'range'
+        elif match.group('op'):
+            value = {_OPERATORS[match.group('op')]:
+                     unquote(match.group('value'))}
+            action = 'range'
+        else:
+            value, action = unquote(match.group('value')), None
+
+        if action == 'range' and (field is None or not value):
+            raise QueryStringError(
+                'Invalid range: {0!r}'.format(match.group(0)))
+        # ex.: an invalid field value, full text colons have to be quoted
+        raw = match.group('value')
+        if field is None and raw and not raw.startswith('"') and ':' in raw:
+            raise QueryStringError(
+                'Invalid term: {0!r}'.format(match.group(0)))
+        terms.append(Term(field, value, action, negate))
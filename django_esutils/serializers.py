@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from rest_framework import serializers
+
+from django_esutils.mappings import SearchMappingType
+
+
+class SourceSerializer(serializers.ModelSerializer):
+    """Model serializer rendering search results from their source, the
+    database object is only read for fields the source does not store.
+
+    ..code-block: python
+
+        class ArticleSourceSerializer(SourceSerializer):
+            class Meta:
+                model = Article
+                fields = ['id', 'subject']
+
+        class ArticleRestListView(SearchListMixin, ListAPIView):
+            serializer_class = ArticleSourceSerializer
+            source_mode = True
+    """
+
+    def to_native(self, obj):
+        if isinstance(obj, SearchMappingType):
+            obj = obj.get_source_object()
+        return super(SourceSerializer, self).to_native(obj)
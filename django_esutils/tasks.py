@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Celery tasks using the bulk API of mapping types."""
+from django.conf import settings
+
+from celery.task import task
+
+# tasks of elasticutils, formerly re-exported as django_esutils.tasks
+from elasticutils.contrib.django.tasks import index_objects  # noqa
+from elasticutils.contrib.django.tasks import unindex_objects  # noqa
+
+from django_esutils import outbox
+
+
+@task
+def bulk_index_objects(mapping_type, ids, es=None, index=None,
+                       database=None):
+    """Indexes objects of a mapping type with bulk requests.
+
+    :arg mapping_type: a `SearchMappingType` subclass.
+    :arg ids: ids of the objects to index.
+    :arg database: database alias to read objects from.
+    """
+    if getattr(settings, 'ES_DISABLED', False):
+        return
+    return mapping_type.bulk_index_ids(ids, es=es, index=index,
+                                       database=database)
+
+
+@task
+def bulk_unindex_objects(mapping_type, ids, es=None, index=None):
+    """Unindexes objects of a mapping type with bulk requests.
+
+    :arg mapping_type: a `SearchMappingType` subclass.
+    :arg ids: ids of the objects to unindex.
+    """
+    if getattr(settings, 'ES_DISABLED', False):
+        return
+    return mapping_type.bulk_unindex_ids(ids, es=es, index=index)
+
+
+@task
+def bulk_update_objects(mapping_type, ids, doc, es=None, index=None,
+                        database=None):
+    """Partially updates documents of a mapping type with bulk requests.
+
+    :arg mapping_type: a `SearchMappingType` subclass.
+    :arg ids: ids of the objects to update.
+    :arg doc: values to update, ex.: ``{'status': 1}``.
+    """
+    if getattr(settings, 'ES_DISABLED', False):
+        return
+    return mapping_type.bulk_update_ids(ids, doc, es=es, index=index,
+                                        database=database)
+
+
+@task
+def index_partition(mapping_type, min_pk, max_pk, number=1000,
+                    database='default'):
+    """Indexes objects of a mapping type whose pk is in a range.
+
+    :arg mapping_type: a `SearchMappingType` subclass.
+    :arg min_pk: first pk of the range.
+    :arg max_pk: last pk of the range.
+    """
+    if getattr(settings, 'ES_DISABLED', False):
+        return
+    return mapping_type.index_partition(min_pk, max_pk, number=number,
+                                        database=database)
+
+
+@task
+def index_delta(mapping_type, database='default'):
+    """Runs the delta sync of a mapping type, see
+    `SearchMappingType.run_index_delta`.
+
+    :arg mapping_type: a `SearchMappingType` subclass.
+    """
+    if getattr(settings, 'ES_DISABLED', False):
+        return
+    return mapping_type.run_index_delta(database=database)
+
+
+@task
+def drain_outbox(batch_size=5000, database='default'):
+    """Drains the indexing outbox, see `django_esutils.outbox`."""
+    if getattr(settings, 'ES_DISABLED', False):
+        return
+    return outbox.drain_outbox(batch_size=batch_size, database=database)[0]
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Transaction scoped coalescing of index jobs.
+
+Inside `coalesce_indexing`, the ids signal handlers would index or unindex
+are buffered and deduplicated per mapping type. Once the transaction is
+committed, a single index job and a single unindex job are sent per mapping
+type. Nothing is sent if it is rolled back.
+
+..code-block: python
+
+    with coalesce_indexing():
+        for i in range(5):
+            article.save()  # article is indexed once, after commit
+
+    @coalesce_indexing
+    def my_view(request):
+        ...
+"""
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db import transaction
+
+
+_state = threading.local()
+
+
+def _get_stack():
+    if not hasattr(_state, 'stack'):
+        _state.stack = []
+    return _state.stack
+
+
+class IndexBuffer(object):
+    """Ids to index or unindex, last operation on an id wins."""
+
+    def __init__(self):
+        # (mapping_type, database) -> {id: 'index' or 'unindex'}
+        self.jobs = OrderedDict()
+
+    def add(self, mapping_type, ids, op, database=None):
+        jobs = self.jobs.setdefault((mapping_type, database), OrderedDict())
+        for obj_id in ids:
+            jobs.pop(obj_id, None)
+            jobs[obj_id] = op
+
+    def merge(self, other):
+        for (mapping_type, database), jobs in other.jobs.items():
+            for obj_id, op in jobs.items():
+                self.add(mapping_type, [obj_id], op, database=database)
+
+    def get_ids(self, mapping_type, op, database=None):
+        jobs = self.jobs.get((mapping_type, database), {})
+        return [obj_id for obj_id, _op in jobs.items() if _op == op]
+
+    def flush(self):
+        """Sends one unindex job and one index job per mapping type."""
+        for mapping_type, database in list(self.jobs):
+            mapping_type.run_unindex(
+                self.get_ids(mapping_type, 'unindex', database=database))
+            mapping_type.run_index(
+                self.get_ids(mapping_type, 'index', database=database),
+                database=database)
+        self.jobs.clear()
+
+
+def run_on_commit(func, using=None):
+    """Calls func once the running transaction of the database commits, or
+    right away out of a transaction.
+
+    .. Note::
+
+        Django < 1.9 has no commit hook, func is called right away.
+    """
+    on_commit = getattr(transaction, 'on_commit', None)
+    connection = transaction.get_connection(using)
+    if on_commit is not None and connection.in_atomic_block:
+        on_commit(func, using=using)
+    else:
+        func()
+
+
+def get_index_buffer():
+    """Returns the buffer of the innermost `coalesce_indexing` block, None
+    outside of it."""
+    stack = _get_stack()
+    return stack[-1] if stack else None
+
+
+def buffer_ids(mapping_type, ids, op, database=None):
+    """Buffers ids to index or unindex if inside `coalesce_indexing`.
+
+    Returns False if there is no buffer, jobs have to be sent right away.
+    """
+    buffer = get_index_buffer()
+    if buffer is None:
+        return False
+    buffer.add(mapping_type, ids, op, database=database)
+    return True
+
+
+class CoalesceIndexing(object):
+    """Context manager and decorator running in `transaction.atomic` and
+    buffering index jobs until commit, see `coalesce_indexing`."""
+
+    def __init__(self, using=None):
+        self.using = using
+
+    def __enter__(self):
+        self.atomic = transaction.atomic(using=self.using)
+        self.atomic.__enter__()
+        _get_stack().append(IndexBuffer())
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        buffer = _get_stack().pop()
+        self.atomic.__exit__(exc_type, exc_value, traceback)
+
+        # rolled back
+        if exc_type is not None:
+            return
+
+        # nested block, jobs are sent by the outermost one
+        parent = get_index_buffer()
+        if parent is not None:
+            parent.merge(buffer)
+            return
+
+        # an outer transaction is still running, wait for it if possible
+        run_on_commit(buffer.flush, using=self.using)
+
+    def __call__(self, func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with CoalesceIndexing(self.using):
+                return func(*args, **kwargs)
+        return inner
+
+
+def coalesce_indexing(using=None):
+    """Returns a `CoalesceIndexing` for the database, can be used as a
+    decorator with or without arguments, like `transaction.atomic`.
+
+    .. Note::
+
+        Django < 1.9 has no commit hook: it should wrap the outermost
+        transaction, otherwise jobs are sent when the block exits.
+    """
+    if callable(using):
+        return CoalesceIndexing(DEFAULT_DB_ALIAS)(using)
+    return CoalesceIndexing(using)
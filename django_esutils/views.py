@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from django.core.paginator import EmptyPage
+from django.core.paginator import PageNotAnInteger
+from django.core.paginator import Paginator
+
+from elasticutils import SearchResults
+
+from django_esutils.mappings import S
+
+
+class SearchPaginator(Paginator):
+    """Paginator of searches, ex.: an `S` or an `ElasticutilsFilterSet`,
+    getting the hits of a page and the total number of hits from a single
+    request instead of a count request plus a page request.
+
+    Pages object_list are `SearchResults`.
+    """
+
+    def validate_number(self, number):
+        """Validates a page number, its upper bound once the total is known
+        only: rest_framework validates it before getting the page, which
+        would send a count request."""
+        if self._count is not None:
+            return super(SearchPaginator, self).validate_number(number)
+
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        # total already known, ex.: num_pages for the 'last' page
+        if self._count is not None:
+            return super(SearchPaginator, self).page(number)
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        results = self.object_list[bottom:top + self.orphans].execute()
+        self._count = results.count
+        number = self.validate_number(number)
+
+        # orphans are kept on the last page only
+        if top + self.orphans < self._count:
+            results.objects = results.objects[:self.per_page]
+        return self._get_page(results, number, self)
+
+
+class SearchListMixin(object):
+    """Mixin of rest_framework list views of search results: results of a
+    page are hydrated by a single query, see `SearchMappingType.hydrate`,
+    instead of a query per result, and paginated by `SearchPaginator`.
+
+    In source mode, results are passed as is to the serializer, which should
+    render them from their source, see `SourceSerializer`.
+
+    ..code-block: python
+
+        class ArticleRestListView(SearchListMixin, ListAPIView):
+            ...
+    """
+
+    paginator_class = SearchPaginator
+    source_mode = False
+
+    def hydrate(self, results):
+        """Returns model instances of results, search results only."""
+        if isinstance(results, S):
+            results = results.execute()
+        if not isinstance(results, SearchResults):
+            return results
+        if self.source_mode:
+            return list(results)
+        return results.type.hydrate_results(results)
+
+    def paginate_queryset(self, queryset, page_size=None):
+        if page_size is not None:
+            # deprecated rest_framework style
+            return super(SearchListMixin, self).paginate_queryset(
+                queryset, page_size=page_size)
+        page = super(SearchListMixin, self).paginate_queryset(queryset)
+        if page is not None:
+            page.object_list = self.hydrate(page.object_list)
+        return page
+
+    def get_serializer(self, instance=None, *args, **kwargs):
+        if kwargs.get('many'):
+            instance = self.hydrate(instance)
+        return super(SearchListMixin, self).get_serializer(instance, *args,
+                                                           **kwargs)